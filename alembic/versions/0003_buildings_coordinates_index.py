@@ -0,0 +1,28 @@
+"""buildings coordinates index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # GiST по точке (долгота, широта): прямоугольник-префильтр поиска в радиусе и поиск в прямоугольнике (<@)
+    op.create_index(
+        'ix_buildings_location', 'buildings', [sa.text('point(longitude, latitude)')],
+        unique=False, postgresql_using='gist'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_buildings_location', table_name='buildings')
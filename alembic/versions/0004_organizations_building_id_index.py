@@ -0,0 +1,25 @@
+"""organizations building_id index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Кандидатов из прямоугольника соединяем с организациями по building_id
+    op.create_index(op.f('ix_organizations_building_id'), 'organizations', ['building_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_organizations_building_id'), table_name='organizations')
@@ -0,0 +1,38 @@
+"""trigram search indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_organizations_name_trgm', 'organizations', ['name'],
+        unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_buildings_address_trgm', 'buildings', ['address'],
+        unique=False, postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_activities_name_trgm', 'activities', ['name'],
+        unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_activities_name_trgm', table_name='activities')
+    op.drop_index('ix_buildings_address_trgm', table_name='buildings')
+    op.drop_index('ix_organizations_name_trgm', table_name='organizations')
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Literal, NamedTuple, Optional, Type
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.dependencies import CONSISTENCY_HEADER, SearchArea, cluster_grid, search_area, verify_api_key
+from app.api.fieldsets import parse_fieldset
+from app.api.pagination import decode_id_cursor, decode_score_cursor, encode_id_cursor, encode_score_cursor
+from app.config import settings
+from app.database import session_scope
+from app.instrumentation import query_budget
+from app.repositories.base_repository import Page
+from app.repositories.building_repository import BuildingRepository
+from app.schemas.building import BuildingResponse
+from app.services.building_service import BuildingService
+from app.services.organization_service import OrganizationService
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+# Самый дорогой подзапрос - поиск ближайших с расширением радиуса (до 13 SQL-запросов)
+SUBQUERY_BUDGET = 13
+
+
+class _FieldsParams(BaseModel):
+    fields: Optional[str] = Field(None, description="Поля ответа через запятую, как в GET-маршрутах")
+    include: Optional[str] = Field(None, description="Дополнительные связи через запятую")
+
+    @property
+    def fieldset(self):
+        return parse_fieldset(self.fields, self.include)
+
+
+class _PageParams(_FieldsParams):
+    after: Optional[str] = Field(None, description="Курсор следующей страницы (next_cursor прошлого ответа)")
+    limit: int = Field(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+    with_total: bool = False
+
+
+class OrganizationParams(_FieldsParams):
+    organization_id: int
+
+
+class OrganizationIdsParams(_FieldsParams):
+    ids: List[int] = Field(..., min_length=1, max_length=settings.MAX_PAGE_SIZE)
+
+
+class BuildingPageParams(_PageParams):
+    building_id: int
+
+
+class ActivityPageParams(_PageParams):
+    activity_id: int
+
+
+class RectangleParams(_PageParams):
+    min_lat: float = Field(..., ge=-90, le=90)
+    max_lat: float = Field(..., ge=-90, le=90)
+    min_lon: float = Field(..., ge=-180, le=180)
+    max_lon: float = Field(..., ge=-180, le=180)
+
+
+class RadiusParams(_FieldsParams):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    radius_m: float = Field(..., gt=0, le=100000)
+    limit: int = Field(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE)
+    with_total: bool = False
+
+
+class NearestParams(_FieldsParams):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    k: int = Field(10, ge=1, le=100)
+    activity_id: Optional[int] = None
+
+
+class NameParams(_PageParams):
+    name: str = Field(..., min_length=1)
+
+
+class SearchParams(_PageParams):
+    activity_id: Optional[int] = None
+    min_lat: Optional[float] = Field(None, ge=-90, le=90)
+    max_lat: Optional[float] = Field(None, ge=-90, le=90)
+    min_lon: Optional[float] = Field(None, ge=-180, le=180)
+    max_lon: Optional[float] = Field(None, ge=-180, le=180)
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=100000)
+    name: Optional[str] = Field(None, min_length=1)
+
+
+class BuildingListParams(BaseModel):
+    after: Optional[str] = None
+    limit: int = Field(100, ge=1, le=settings.MAX_PAGE_SIZE)
+
+
+class BuildingParams(BaseModel):
+    building_id: int
+
+
+class BuildingIdsParams(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=settings.MAX_PAGE_SIZE)
+
+
+class ClustersParams(BaseModel):
+    bbox: str
+    zoom: int = Field(..., ge=0, le=22)
+
+
+def _page(page: Page, encode: Callable[[Any], Optional[str]] = encode_id_cursor) -> dict:
+    return {"items": page.items, "next_cursor": encode(page.next_after), "total": page.total}
+
+
+def _unique(ids: List[int]) -> tuple:
+    return tuple(dict.fromkeys(ids))
+
+
+# Подзапросы повторяют GET-маршруты: те же параметры и те же методы сервиса и репозиториев.
+# None в результате означает "не найдено" (404)
+
+async def _organization(db: AsyncSession, p: OrganizationParams):
+    return await OrganizationService(db).get_organization(p.organization_id, p.fieldset)
+
+
+async def _organizations_batch(db: AsyncSession, p: OrganizationIdsParams) -> dict:
+    batch = await OrganizationService(db).get_organizations_batch(_unique(p.ids), p.fieldset)
+    return {"items": batch.items, "missing": batch.missing}
+
+
+async def _organizations_by_building(db: AsyncSession, p: BuildingPageParams) -> dict:
+    return _page(await OrganizationService(db).get_organizations_by_building(
+        p.building_id, decode_id_cursor(p.after), p.limit, p.with_total, p.fieldset
+    ))
+
+
+async def _organizations_by_activity(db: AsyncSession, p: ActivityPageParams) -> dict:
+    return _page(await OrganizationService(db).get_organizations_by_activity(
+        p.activity_id, decode_id_cursor(p.after), p.limit, p.with_total, p.fieldset
+    ))
+
+
+async def _organizations_by_activity_tree(db: AsyncSession, p: ActivityPageParams) -> dict:
+    return _page(await OrganizationService(db).get_organizations_by_activity_tree(
+        p.activity_id, decode_id_cursor(p.after), p.limit, p.with_total, p.fieldset
+    ))
+
+
+async def _organizations_in_rectangle(db: AsyncSession, p: RectangleParams) -> dict:
+    return _page(await OrganizationService(db).get_organizations_in_rectangle(
+        p.min_lat, p.max_lat, p.min_lon, p.max_lon, decode_id_cursor(p.after), p.limit, p.with_total, p.fieldset
+    ))
+
+
+async def _organizations_in_radius(db: AsyncSession, p: RadiusParams) -> dict:
+    return _page(await OrganizationService(db).get_organizations_in_radius(
+        p.lat, p.lon, p.radius_m, p.limit, p.with_total, p.fieldset
+    ))
+
+
+async def _nearest_organizations(db: AsyncSession, p: NearestParams) -> List[dict]:
+    return await OrganizationService(db).get_nearest_organizations(p.lat, p.lon, p.k, p.activity_id, p.fieldset)
+
+
+async def _organizations_by_name(db: AsyncSession, p: NameParams) -> dict:
+    page = await OrganizationService(db).search_organizations_by_name(
+        p.name, decode_score_cursor(p.after), p.limit, p.with_total, p.fieldset
+    )
+    return _page(page, encode_score_cursor)
+
+
+async def _search_organizations(db: AsyncSession, p: SearchParams) -> dict:
+    area = search_area(p.min_lat, p.max_lat, p.min_lon, p.max_lon, p.lat, p.lon, p.radius_m)
+    if p.activity_id is None and area == SearchArea() and p.name is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Задайте хотя бы один фильтр: activity_id, область или name"
+        )
+    return _page(await OrganizationService(db).search_organizations(
+        p.activity_id, area.rectangle, area.circle, p.name, decode_id_cursor(p.after), p.limit, p.with_total,
+        p.fieldset
+    ))
+
+
+async def _buildings(db: AsyncSession, p: BuildingListParams) -> dict:
+    page = await BuildingRepository(db).get_page(decode_id_cursor(p.after), p.limit)
+    return _page(page._replace(items=[BuildingResponse.model_validate(building) for building in page.items]))
+
+
+async def _building(db: AsyncSession, p: BuildingParams) -> Optional[BuildingResponse]:
+    building = await BuildingRepository(db).get(p.building_id)
+    return BuildingResponse.model_validate(building) if building else None
+
+
+async def _buildings_batch(db: AsyncSession, p: BuildingIdsParams) -> dict:
+    batch = await BuildingRepository(db).get_batch(_unique(p.ids))
+    items = [BuildingResponse.model_validate(building) for building in batch.items]
+    return {"items": items, "missing": batch.missing}
+
+
+async def _buildings_clusters(db: AsyncSession, p: ClustersParams) -> List[dict]:
+    grid = cluster_grid(p.bbox, p.zoom)
+    return await BuildingService(db).get_clusters(*grid.rectangle, grid.cell_size)
+
+
+class Operation(NamedTuple):
+    params: Type[BaseModel]
+    run: Callable[[AsyncSession, Any], Awaitable[Any]]
+
+
+OPERATIONS: Dict[str, Operation] = {
+    "organizations.get": Operation(OrganizationParams, _organization),
+    "organizations.batch": Operation(OrganizationIdsParams, _organizations_batch),
+    "organizations.by_building": Operation(BuildingPageParams, _organizations_by_building),
+    "organizations.by_activity": Operation(ActivityPageParams, _organizations_by_activity),
+    "organizations.activity_tree": Operation(ActivityPageParams, _organizations_by_activity_tree),
+    "organizations.rectangle": Operation(RectangleParams, _organizations_in_rectangle),
+    "organizations.radius": Operation(RadiusParams, _organizations_in_radius),
+    "organizations.nearest": Operation(NearestParams, _nearest_organizations),
+    "organizations.name": Operation(NameParams, _organizations_by_name),
+    "organizations.search": Operation(SearchParams, _search_organizations),
+    "buildings.list": Operation(BuildingListParams, _buildings),
+    "buildings.get": Operation(BuildingParams, _building),
+    "buildings.batch": Operation(BuildingIdsParams, _buildings_batch),
+    "buildings.clusters": Operation(ClustersParams, _buildings_clusters),
+}
+
+
+class SubQuery(BaseModel):
+    id: Optional[str] = Field(None, description="Метка подзапроса, возвращается в его результате")
+    op: Literal[tuple(OPERATIONS)] = Field(..., description="Операция, соответствующая GET-маршруту")
+    params: Dict[str, Any] = Field(default_factory=dict, description="Параметры операции, как в GET-маршруте")
+
+
+class BatchRequest(BaseModel):
+    queries: List[SubQuery] = Field(..., min_length=1, max_length=settings.BATCH_MAX_QUERIES)
+
+
+class SubQueryResult(BaseModel):
+    id: Optional[str] = None
+    op: str
+    status: int = Field(..., description="HTTP-статус, который вернул бы соответствующий GET-маршрут")
+    result: Any = None
+    error: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    results: List[SubQueryResult]
+
+
+async def _execute(query: SubQuery, params: BaseModel, primary: bool, semaphore: asyncio.Semaphore) -> SubQueryResult:
+    async with semaphore:
+        try:
+            # Своя сессия на подзапрос: одна AsyncSession не выполняет запросы параллельно
+            async with session_scope(primary=primary) as db:
+                result = await OPERATIONS[query.op].run(db, params)
+        except HTTPException as error:
+            return SubQueryResult(id=query.id, op=query.op, status=error.status_code, error=error.detail)
+        except Exception:
+            logger.exception("Подзапрос %s пакета завершился ошибкой", query.op)
+            return SubQueryResult(
+                id=query.id, op=query.op, status=status.HTTP_500_INTERNAL_SERVER_ERROR, error="Внутренняя ошибка"
+            )
+    if result is None:
+        return SubQueryResult(id=query.id, op=query.op, status=status.HTTP_404_NOT_FOUND, error="Не найдено")
+    return SubQueryResult(id=query.id, op=query.op, status=status.HTTP_200_OK, result=jsonable_encoder(result))
+
+
+@router.post(
+    "", response_model=BatchResponse,
+    dependencies=[query_budget(settings.BATCH_MAX_QUERIES * SUBQUERY_BUDGET)]
+)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    _api_key: str = Depends(verify_api_key)
+):
+    """Выполнить несколько запросов справочника за один вызов.
+
+    Подзапросы идут параллельно, каждый в своей сессии из пула (не больше
+    BATCH_CONCURRENCY одновременно), результаты - в порядке подзапросов.
+    Ошибка одного подзапроса не прерывает остальные.
+    """
+    errors = []
+    params = []
+    for index, query in enumerate(batch.queries):
+        try:
+            params.append(OPERATIONS[query.op].params.model_validate(query.params))
+        except ValidationError as error:
+            errors.append({
+                "query": index, "op": query.op, "errors": error.errors(include_url=False, include_context=False)
+            })
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+
+    primary = request.headers.get(CONSISTENCY_HEADER) == "primary"
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+    results = await asyncio.gather(*(
+        _execute(query, query_params, primary, semaphore) for query, query_params in zip(batch.queries, params)
+    ))
+    return BatchResponse(results=results)
@@ -1,27 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
-from app.api.dependencies import verify_api_key, get_current_db
+from typing import List, Optional, Tuple
+from app.api.dependencies import (
+    ClusterGrid, batch_ids, cluster_grid, memory_geo_bypass, verify_api_key, get_current_db
+)
+from app.api.pagination import decode_id_cursor, encode_id_cursor, set_next_cursor
+from app.instrumentation import query_budget
 from app.repositories.building_repository import BuildingRepository
-from app.schemas.building import BuildingResponse
+from app.schemas.building import BuildingBatchResponse, BuildingClusterResponse, BuildingResponse
+from app.services.building_service import BuildingService
 
 router = APIRouter(prefix="/buildings", tags=["buildings"])
 
 
-@router.get("/", response_model=List[BuildingResponse])
+@router.get("/", response_model=List[BuildingResponse], dependencies=[query_budget(2)])
 async def get_buildings(
-    skip: int = Query(0, ge=0),
+    request: Request,
+    response: Response,
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Устарело, используйте after"),
     limit: int = Query(100, ge=1, le=1000),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить список всех зданий"""
+    """Получить список всех зданий (курсор следующей страницы - в X-Next-Cursor)"""
     repository = BuildingRepository(db)
-    buildings = await repository.get_all(skip, limit)
+    if skip and after is None:
+        buildings = await repository.get_all(skip, limit)
+        next_after = buildings[-1].id if len(buildings) == limit else None
+    else:
+        page = await repository.get_page(decode_id_cursor(after), limit)
+        buildings, next_after = page.items, page.next_after
+    set_next_cursor(request, response, encode_id_cursor(next_after))
     return [BuildingResponse.model_validate(building) for building in buildings]
 
 
-@router.get("/{building_id}", response_model=BuildingResponse)
+@router.get("/batch", response_model=BuildingBatchResponse, dependencies=[query_budget(1)])
+async def get_buildings_batch(
+    ids: Tuple[int, ...] = Depends(batch_ids),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Получить здания по списку ID одним запросом: в порядке ids, ненайденные - в missing"""
+    batch = await BuildingRepository(db).get_batch(ids)
+    return BuildingBatchResponse(
+        items=[BuildingResponse.model_validate(building) for building in batch.items], missing=batch.missing
+    )
+
+
+@router.get(
+    "/clusters", response_model=List[BuildingClusterResponse],
+    dependencies=[query_budget(1), Depends(memory_geo_bypass)]
+)
+async def get_buildings_clusters(
+    grid: ClusterGrid = Depends(cluster_grid),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Кластеры зданий для карты: по ячейке сетки уровня zoom - центр, число зданий и ID одного из них.
+
+    Размер ответа ограничен числом ячеек на экране (CLUSTER_MAX_CELLS), а не числом зданий.
+    """
+    return await BuildingService(db).get_clusters(*grid.rectangle, grid.cell_size)
+
+
+@router.get("/{building_id}", response_model=BuildingResponse, dependencies=[query_budget(1)])
 async def get_building(
     building_id: int,
     _api_key: str = Depends(verify_api_key),
@@ -1,7 +1,13 @@
-from fastapi import Depends, HTTPException, status, Header
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
+from typing import NamedTuple, Optional, Tuple
+from fastapi import HTTPException, Query, Request, status, Header
+from app.database import session_scope
 from app.config import settings
+from app.geo import grid_cell, grid_cell_size
+from app.instrumentation import cache_maintenance
+from app.repositories.versioned_snapshot import fetch_data_versions
+
+READ_METHODS = ("GET", "HEAD")
+CONSISTENCY_HEADER = "X-Consistency"
 
 
 def verify_api_key(x_api_key: str = Header(...)):
@@ -14,6 +20,106 @@ def verify_api_key(x_api_key: str = Header(...)):
     return x_api_key
 
 
-async def get_current_db(db: AsyncSession = Depends(get_db)):
-    """Получение сессии базы данных"""
-    return db
+def reads_from_primary(request: Request) -> bool:
+    """Запрос требует основную базу: запись или чтение сразу после записи (X-Consistency: primary)"""
+    return request.method not in READ_METHODS or request.headers.get(CONSISTENCY_HEADER) == "primary"
+
+
+async def get_current_db(request: Request):
+    """Получение сессии базы данных: чтения идут на реплику, если она настроена"""
+    async with session_scope(primary=reads_from_primary(request)) as db:
+        if getattr(request.state, "response_cache", False):
+            # Версии для ключа кэша ответов - из той же сессии и до данных ответа
+            with cache_maintenance():
+                request.state.data_versions = await fetch_data_versions(db)
+        yield db
+
+
+def bypass_response_cache(request: Request) -> None:
+    """Не сохранять ответ маршрута в кэш ответов.
+
+    Для ответов из индексов в памяти процесса: индекс сверяет версию с БД по
+    своему таймеру и может отставать от версий в ключе кэша.
+    """
+    request.state.response_cache = False
+
+
+def memory_geo_bypass(request: Request) -> None:
+    """bypass_response_cache для геопоиска по индексу в памяти (GEO_ENGINE=memory)"""
+    if settings.GEO_ENGINE == "memory":
+        bypass_response_cache(request)
+
+
+def batch_ids(ids: str = Query(..., description="ID через запятую, не больше MAX_PAGE_SIZE")) -> Tuple[int, ...]:
+    """ID пакетного запроса: без повторов, в порядке первого упоминания"""
+    try:
+        parsed = tuple(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids - целые числа через запятую")
+    if not parsed or len(parsed) > settings.MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ids: от 1 до {settings.MAX_PAGE_SIZE} значений"
+        )
+    return parsed
+
+
+class SearchArea(NamedTuple):
+    """Область поиска: прямоугольник (min_lat, max_lat, min_lon, max_lon) или круг (lat, lon, radius_m)"""
+    rectangle: Optional[Tuple[float, float, float, float]] = None
+    circle: Optional[Tuple[float, float, float]] = None
+
+
+def search_area(
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_m: Optional[float] = Query(None, gt=0, le=100000, description="Радиус поиска в метрах")
+) -> SearchArea:
+    """Прямоугольник задаётся всеми четырьмя границами, круг - центром и радиусом; не больше одного из них"""
+    rectangle = (min_lat, max_lat, min_lon, max_lon)
+    circle = (lat, lon, radius_m)
+    has_rectangle = any(value is not None for value in rectangle)
+    has_circle = any(value is not None for value in circle)
+    if (has_rectangle and None in rectangle) or (has_circle and None in circle):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нужны все границы прямоугольника (min_lat, max_lat, min_lon, max_lon) или центр и радиус круга"
+        )
+    if has_rectangle and has_circle:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Задайте прямоугольник или круг, не оба")
+    return SearchArea(rectangle if has_rectangle else None, circle if has_circle else None)
+
+
+class ClusterGrid(NamedTuple):
+    """Прямоугольник (min_lat, max_lat, min_lon, max_lon) и сторона ячейки сетки в градусах"""
+    rectangle: Tuple[float, float, float, float]
+    cell_size: float
+
+
+def cluster_grid(
+    bbox: str = Query(..., description="Область карты: min_lon,min_lat,max_lon,max_lat"),
+    zoom: int = Query(..., ge=0, le=22, description="Уровень масштаба карты")
+) -> ClusterGrid:
+    """Сетка кластеров: ячейка - доля тайла уровня zoom, область - не больше CLUSTER_MAX_CELLS ячеек"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="bbox - четыре числа: min_lon,min_lat,max_lon,max_lat"
+        )
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox вне координат или min больше max")
+
+    cell_size = grid_cell_size(zoom, settings.CLUSTER_CELLS_PER_TILE)
+    min_row, min_column = grid_cell(min_lat, min_lon, cell_size)
+    max_row, max_column = grid_cell(max_lat, max_lon, cell_size)
+    if (max_row - min_row + 1) * (max_column - min_column + 1) > settings.CLUSTER_MAX_CELLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Область больше {settings.CLUSTER_MAX_CELLS} ячеек сетки: уменьшите bbox или zoom"
+        )
+    return ClusterGrid((min_lat, max_lat, min_lon, max_lon), cell_size)
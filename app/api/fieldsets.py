@@ -0,0 +1,60 @@
+from typing import Any, Callable, Iterable, Optional
+from fastapi import HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse
+from app.repositories.organization_repository import ORGANIZATION_FIELDS, ORGANIZATION_INCLUDES, FieldSet
+
+
+def _parse_names(value: Optional[str], allowed: Iterable[str], parameter: str) -> Optional[frozenset]:
+    if value is None:
+        return None
+    names = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные значения {parameter}: {', '.join(sorted(unknown))}"
+        )
+    return names
+
+
+def parse_fieldset(
+    fields: Optional[str], include: Optional[str],
+    allowed_fields: Iterable[str] = ORGANIZATION_FIELDS, allowed_includes: Iterable[str] = ORGANIZATION_INCLUDES
+) -> FieldSet:
+    """FieldSet из строк fields и include через запятую; неизвестные имена - ошибка 400"""
+    return FieldSet(
+        fields=_parse_names(fields, allowed_fields, "fields"),
+        include=_parse_names(include, allowed_includes, "include") or frozenset()
+    )
+
+
+def fieldset_dependency(allowed_fields: Iterable[str], allowed_includes: Iterable[str] = ()) -> Callable[..., FieldSet]:
+    """Зависимость, разбирающая параметры fields и include в FieldSet"""
+    allowed_fields, allowed_includes = tuple(allowed_fields), tuple(allowed_includes)
+
+    def get_fieldset(
+        fields: Optional[str] = Query(
+            None, description=f"Поля ответа через запятую (id возвращается всегда): {', '.join(allowed_fields)}"
+        ),
+        include: Optional[str] = Query(
+            None, description=f"Дополнительные связи через запятую: {', '.join(allowed_includes) or '-'}"
+        ),
+    ) -> FieldSet:
+        return parse_fieldset(fields, include, allowed_fields, allowed_includes)
+
+    return get_fieldset
+
+
+organization_fieldset = fieldset_dependency(ORGANIZATION_FIELDS, ORGANIZATION_INCLUDES)
+
+
+def sparse_response(content: Any, fieldset: FieldSet, response: Optional[Response] = None) -> Any:
+    """Ответ с неполным набором полей отдаётся как есть, минуя проверку по response_model.
+
+    Полный набор возвращается без изменений и проходит через response_model роутера.
+    Заголовки, уже выставленные в response (курсор, оценка числа), переносятся.
+    """
+    if fieldset.is_default:
+        return content
+    headers = dict(response.headers) if response is not None else None
+    return JSONResponse(content=content, headers=headers)
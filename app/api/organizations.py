@@ -1,96 +1,312 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
-from app.api.dependencies import verify_api_key, get_current_db
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional, Tuple
+from app.api.dependencies import (
+    SearchArea, batch_ids, bypass_response_cache, memory_geo_bypass, search_area, verify_api_key, get_current_db,
+    reads_from_primary
+)
+from app.api.fieldsets import fieldset_dependency, organization_fieldset, sparse_response
+from app.api.pagination import (
+    decode_id_cursor, encode_id_cursor, decode_score_cursor, encode_score_cursor, set_next_cursor, set_total_estimate
+)
+from app.config import settings
+from app.instrumentation import query_budget
 from app.services.organization_service import OrganizationService
-from app.schemas.organization import OrganizationResponse, OrganizationListResponse
+from app.services.organization_export import EXPORT_MEDIA_TYPES, export_organizations
+from app.repositories.organization_repository import FieldSet
+from app.repositories.text_search import has_pg_trgm, organization_prefix_index
+from app.schemas.organization import (
+    OrganizationBatchResponse, OrganizationResponse, OrganizationListResponse, OrganizationWithDistanceResponse,
+    OrganizationSuggestionResponse
+)
 
 router = APIRouter(prefix="/organizations", tags=["organizations"])
 
+organization_list_fieldset = fieldset_dependency(OrganizationListResponse.model_fields)
 
-@router.get("/", response_model=List[OrganizationListResponse])
+
+@router.get("/", response_model=List[OrganizationListResponse], dependencies=[query_budget(2)])
 async def get_organizations(
-    skip: int = Query(0, ge=0),
+    request: Request,
+    response: Response,
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Устарело, используйте after"),
     limit: int = Query(100, ge=1, le=1000),
+    fieldset: FieldSet = Depends(organization_list_fieldset),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Получить список всех организаций (курсор следующей страницы - в X-Next-Cursor)"""
+    service = OrganizationService(db)
+    if skip and after is None:
+        organizations = await service.organization_repo.get_all(skip, limit)
+        next_after = organizations[-1].id if len(organizations) == limit else None
+    else:
+        page = await service.organization_repo.get_page(decode_id_cursor(after), limit)
+        organizations, next_after = page.items, page.next_after
+    set_next_cursor(request, response, encode_id_cursor(next_after))
+    if fieldset.is_default:
+        return [OrganizationListResponse.model_validate(org) for org in organizations]
+    names = [name for name in OrganizationListResponse.model_fields if fieldset.wants(name)]
+    return sparse_response(
+        [{name: getattr(org, name) for name in names} for org in organizations], fieldset, response
+    )
+
+
+@router.get(
+    "/autocomplete", response_model=List[OrganizationSuggestionResponse],
+    dependencies=[query_budget(0), Depends(bypass_response_cache)]
+)
+async def autocomplete_organizations(
+    prefix: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(10, ge=1, le=50),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Подсказки по началу названия организации из индекса в памяти (БД - только сверка его версии)"""
+    await organization_prefix_index.refresh(db)
+    return [
+        OrganizationSuggestionResponse(id=id, name=name)
+        for id, name in organization_prefix_index.search(prefix, limit)
+    ]
+
+
+@router.get("/export", response_class=StreamingResponse, dependencies=[query_budget(2)])
+async def export_organizations_directory(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Формат выгрузки"),
+    fieldset: FieldSet = Depends(organization_fieldset),
+    primary: bool = Depends(reads_from_primary),
+    _api_key: str = Depends(verify_api_key)
+):
+    """Выгрузить все организации потоком: строки читаются из БД серверным курсором пачками"""
+    return StreamingResponse(
+        export_organizations(format, fieldset, primary),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="organizations.{format}"'}
+    )
+
+
+@router.get("/batch", response_model=OrganizationBatchResponse, dependencies=[query_budget(1)])
+async def get_organizations_batch(
+    ids: Tuple[int, ...] = Depends(batch_ids),
+    fieldset: FieldSet = Depends(organization_fieldset),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Получить организации по списку ID одним запросом: в порядке ids, ненайденные - в missing"""
+    service = OrganizationService(db)
+    batch = await service.get_organizations_batch(ids, fieldset)
+    return sparse_response({"items": batch.items, "missing": batch.missing}, fieldset)
+
+
+@router.get("/search", response_model=List[OrganizationResponse], dependencies=[query_budget(3)])
+async def search_organizations(
+    request: Request,
+    response: Response,
+    activity_id: Optional[int] = Query(None, description="Вид деятельности (включая дочерние)"),
+    area: SearchArea = Depends(search_area),
+    name: Optional[str] = Query(None, min_length=1, description="Подстрока названия"),
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить список всех организаций"""
+    """Поиск организаций сразу по нескольким фильтрам одним запросом к БД, постранично в порядке id.
+
+    Фильтры (хотя бы один): дерево деятельности, прямоугольник или круг, подстрока названия.
+    """
+    if activity_id is None and area == SearchArea() and name is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Задайте хотя бы один фильтр: activity_id, область или name"
+        )
+    if area != SearchArea():
+        memory_geo_bypass(request)
     service = OrganizationService(db)
-    organizations = await service.organization_repo.get_all(skip, limit)
-    return [OrganizationListResponse.model_validate(org) for org in organizations]
+    page = await service.search_organizations(
+        activity_id, area.rectangle, area.circle, name, decode_id_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_id_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
 
 
-@router.get("/{organization_id}", response_model=OrganizationResponse)
+@router.get("/{organization_id}", response_model=OrganizationResponse, dependencies=[query_budget(4)])
 async def get_organization(
     organization_id: int,
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
     """Получить информацию об организации по ID"""
     service = OrganizationService(db)
-    organization = await service.get_organization(organization_id)
+    organization = await service.get_organization(organization_id, fieldset)
     if not organization:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Организация не найдена"
         )
-    return organization
+    return sparse_response(organization, fieldset)
 
 
-@router.get("/building/{building_id}", response_model=List[OrganizationResponse])
+@router.get("/building/{building_id}", response_model=List[OrganizationResponse], dependencies=[query_budget(2)])
 async def get_organizations_by_building(
+    request: Request,
+    response: Response,
     building_id: int,
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить список всех организаций в конкретном здании"""
+    """Получить список всех организаций в конкретном здании, постранично"""
     service = OrganizationService(db)
-    return await service.get_organizations_by_building(building_id)
+    page = await service.get_organizations_by_building(
+        building_id, decode_id_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_id_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
 
 
-@router.get("/activity/{activity_id}", response_model=List[OrganizationResponse])
+@router.get("/activity/{activity_id}", response_model=List[OrganizationResponse], dependencies=[query_budget(2)])
 async def get_organizations_by_activity(
+    request: Request,
+    response: Response,
     activity_id: int,
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить список всех организаций по виду деятельности"""
+    """Получить список всех организаций по виду деятельности, постранично"""
     service = OrganizationService(db)
-    return await service.get_organizations_by_activity(activity_id)
+    page = await service.get_organizations_by_activity(
+        activity_id, decode_id_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_id_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
 
 
-@router.get("/activity-tree/{activity_id}", response_model=List[OrganizationResponse])
+@router.get("/activity-tree/{activity_id}", response_model=List[OrganizationResponse], dependencies=[query_budget(4)])
 async def get_organizations_by_activity_tree(
+    request: Request,
+    response: Response,
     activity_id: int,
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить список организаций по дереву деятельности (включая дочерние)"""
+    """Получить список организаций по дереву деятельности (включая дочерние), постранично"""
     service = OrganizationService(db)
-    return await service.get_organizations_by_activity_tree(activity_id)
+    page = await service.get_organizations_by_activity_tree(
+        activity_id, decode_id_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_id_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
 
 
-@router.get("/search/rectangle", response_model=List[OrganizationResponse])
+@router.get(
+    "/search/rectangle", response_model=List[OrganizationResponse],
+    dependencies=[query_budget(3), Depends(memory_geo_bypass)]
+)
 async def get_organizations_in_rectangle(
+    request: Request,
+    response: Response,
     min_lat: float = Query(..., ge=-90, le=90),
     max_lat: float = Query(..., ge=-90, le=90),
     min_lon: float = Query(..., ge=-180, le=180),
     max_lon: float = Query(..., ge=-180, le=180),
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Получить организации в прямоугольной области, постранично"""
+    service = OrganizationService(db)
+    page = await service.get_organizations_in_rectangle(
+        min_lat, max_lat, min_lon, max_lon, decode_id_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_id_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
+
+
+@router.get(
+    "/search/radius", response_model=List[OrganizationWithDistanceResponse],
+    dependencies=[query_budget(3), Depends(memory_geo_bypass)]
+)
+async def get_organizations_in_radius(
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=100000, description="Радиус поиска в метрах"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть число найденных в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
+    _api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_current_db)
+):
+    """Получить организации в радиусе от точки, ближайшие первыми (не больше limit)"""
+    service = OrganizationService(db)
+    page = await service.get_organizations_in_radius(lat, lon, radius_m, limit, with_total, fieldset)
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
+
+
+@router.get(
+    "/search/nearest", response_model=List[OrganizationWithDistanceResponse],
+    dependencies=[query_budget(13), Depends(memory_geo_bypass)]
+)
+async def get_nearest_organizations(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100, description="Сколько ближайших организаций вернуть"),
+    activity_id: Optional[int] = Query(None, description="Вид деятельности (включая дочерние)"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Получить организации в прямоугольной области"""
+    """Получить k ближайших к точке организаций"""
     service = OrganizationService(db)
-    return await service.get_organizations_in_rectangle(min_lat, max_lat, min_lon, max_lon)
+    organizations = await service.get_nearest_organizations(lat, lon, k, activity_id, fieldset)
+    return sparse_response(organizations, fieldset)
 
 
-@router.get("/search/name", response_model=List[OrganizationResponse])
+@router.get("/search/name", response_model=List[OrganizationResponse], dependencies=[query_budget(4)])
 async def search_organizations_by_name(
+    request: Request,
+    response: Response,
     name: str = Query(..., min_length=1),
+    after: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    with_total: bool = Query(False, description="Вернуть оценку общего числа в X-Total-Count-Estimate"),
+    fieldset: FieldSet = Depends(organization_fieldset),
     _api_key: str = Depends(verify_api_key),
     db: AsyncSession = Depends(get_current_db)
 ):
-    """Поиск организаций по названию"""
+    """Поиск организаций по названию, наиболее похожие первыми (постранично)"""
+    if not await has_pg_trgm(db):
+        # Без pg_trgm поиск идёт по индексу триграмм в памяти процесса
+        bypass_response_cache(request)
     service = OrganizationService(db)
-    return await service.search_organizations_by_name(name)
+    page = await service.search_organizations_by_name(
+        name, decode_score_cursor(after), limit, with_total, fieldset
+    )
+    set_next_cursor(request, response, encode_score_cursor(page.next_after))
+    set_total_estimate(response, page.total)
+    return sparse_response(page.items, fieldset, response)
@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+from typing import Any, Optional, Tuple
+from fastapi import HTTPException, Request, Response, status
+
+
+def encode_cursor(**values: Any) -> str:
+    """Непрозрачный курсор: ключ сортировки последней записи страницы"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *keys: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        values = None
+    if not isinstance(values, dict) or any(key not in values for key in keys):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+    return values
+
+
+def set_next_cursor(request: Request, response: Response, next_cursor: Optional[str]) -> None:
+    """Передать курсор следующей страницы в заголовках X-Next-Cursor и Link"""
+    if next_cursor is None:
+        return
+    response.headers["X-Next-Cursor"] = next_cursor
+    next_url = request.url.remove_query_params("skip").include_query_params(after=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+def set_total_estimate(response: Response, total: Optional[int]) -> None:
+    """Приблизительное общее число записей (оценка планировщика) в X-Total-Count-Estimate"""
+    if total is not None:
+        response.headers["X-Total-Count-Estimate"] = str(total)
+
+
+def decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    last_id = decode_cursor(cursor, "id")["id"]
+    if not isinstance(last_id, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+    return last_id
+
+
+def encode_id_cursor(last_id: Optional[int]) -> Optional[str]:
+    return encode_cursor(id=last_id) if last_id is not None else None
+
+
+def decode_score_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Курсор поиска по названию: пара (похожесть, id) последней записи"""
+    if cursor is None:
+        return None
+    values = decode_cursor(cursor, "score", "id")
+    if not isinstance(values["score"], (int, float)) or not isinstance(values["id"], int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+    return float(values["score"]), values["id"]
+
+
+def encode_score_cursor(last: Optional[Tuple[float, int]]) -> Optional[str]:
+    return encode_cursor(score=last[0], id=last[1]) if last is not None else None
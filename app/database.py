@@ -1,18 +1,103 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from app.config import settings
+from app.instrumentation import instrument_engine
+from app.metrics import TimedQueuePool, metrics
 
 async_database_url = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(async_database_url)
+
+def _connect_args() -> dict:
+    connect_args = {"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE}
+    if settings.DB_PREPARED_STATEMENT_CACHE_SIZE == 0:
+        # Без кэша asyncpg всё равно готовит выражения: уникальные имена не сталкиваются в pgbouncer
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    return connect_args
+
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url.replace("postgresql://", "postgresql+asyncpg://"),
+        poolclass=TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+    instrument_engine(engine)
+    metrics.engines[name] = engine
+    return engine
+
+
+engine = _create_engine(async_database_url, "primary")
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
+class ReplicaRouter:
+    """Выбор реплики для сессии чтения.
+
+    "least_outstanding" - реплика с наименьшим числом открытых сессий (при
+    равенстве - следующая по кругу), "round_robin" - строго по кругу. Счётчики
+    меняются только из цикла событий, блокировки не нужны.
+    """
+
+    def __init__(self, urls: List[str], strategy: str):
+        self.engines = [_create_engine(url, f"replica{number}") for number, url in enumerate(urls, 1)]
+        self.sessionmakers = [
+            async_sessionmaker(replica, class_=AsyncSession, expire_on_commit=False) for replica in self.engines
+        ]
+        self.outstanding = [0] * len(self.engines)
+        self.strategy = strategy
+        self._next = 0
+
+    def pick(self) -> int:
+        count = len(self.engines)
+        start = self._next
+        self._next = (start + 1) % count
+        if self.strategy == "round_robin":
+            return start
+        best = start
+        for offset in range(1, count):
+            candidate = (start + offset) % count
+            if self.outstanding[candidate] < self.outstanding[best]:
+                best = candidate
+        return best
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        number = self.pick()
+        self.outstanding[number] += 1
         try:
-            yield session
+            async with self.sessionmakers[number]() as session:
+                yield session
         finally:
-            await session.close()
+            self.outstanding[number] -= 1
+
+    async def dispose(self) -> None:
+        for replica in self.engines:
+            await replica.dispose()
+
+
+replica_router = ReplicaRouter(settings.replica_urls, settings.DB_REPLICA_ROUTING) if settings.replica_urls else None
+
+
+async def dispose_engines() -> None:
+    """Закрыть соединения основной базы и реплик (при остановке приложения)"""
+    await engine.dispose()
+    if replica_router is not None:
+        await replica_router.dispose()
+
+
+def session_scope(primary: bool = True):
+    """Сессия основной базы или, для чтения без требования свежести, одной из реплик (если они настроены)"""
+    if primary or replica_router is None:
+        return AsyncSessionLocal()
+    return replica_router.session()
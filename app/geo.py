@@ -0,0 +1,42 @@
+import math
+from typing import Tuple
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу между двумя точками в метрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """Прямоугольник (min_lat, max_lat, min_lon, max_lon), содержащий круг радиуса radius_m.
+
+    Если круг захватывает полюс или пересекает антимеридиан, долгота не ограничивается.
+    """
+    d_lat = radius_m / METERS_PER_DEGREE_LAT
+    min_lat, max_lat = lat - d_lat, lat + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    # Наибольшее отклонение по долготе достигается на краю круга, а не на его широте
+    d_lon = math.degrees(math.asin(min(1.0, math.sin(radius_m / EARTH_RADIUS_M) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - d_lon, lon + d_lon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def grid_cell_size(zoom: int, cells_per_tile: int) -> float:
+    """Сторона ячейки сетки кластеров в градусах: тайл уровня zoom делится на cells_per_tile ячеек по стороне"""
+    return 360 / (2 ** zoom) / cells_per_tile
+
+
+def grid_cell(lat: float, lon: float, cell_size: float) -> Tuple[int, int]:
+    """Ячейка сетки (строка, столбец) с началом в точке (-90, -180)"""
+    return math.floor((lat + 90) / cell_size), math.floor((lon + 180) / cell_size)
@@ -0,0 +1,175 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.config import settings
+
+logger = logging.getLogger("app.sql")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Маршрут выполнил больше SQL-запросов, чем разрешено его бюджетом"""
+
+
+class RequestQueries:
+    """SQL-статистика одного HTTP-запроса: число, суммарное время, самые медленные и повторы"""
+    __slots__ = ("statements", "duration", "slowest", "repeats", "budget", "rejected")
+
+    def __init__(self, budget: int):
+        self.statements = 0
+        self.duration = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+        self.repeats: Dict[str, int] = {}
+        self.budget = budget
+        self.rejected = 0
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.duration += duration
+        self.repeats[statement] = self.repeats.get(statement, 0) + 1
+        if len(self.slowest) < settings.SQL_SLOWEST_STATEMENTS or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: -item[0])
+            del self.slowest[settings.SQL_SLOWEST_STATEMENTS:]
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Одинаковые запросы, выполненные не меньше SQL_REPEAT_THRESHOLD раз: признак N+1"""
+        return [
+            (statement, count) for statement, count in self.repeats.items()
+            if count >= settings.SQL_REPEAT_THRESHOLD
+        ]
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+_maintenance: ContextVar[bool] = ContextVar("cache_maintenance", default=False)
+
+
+def current_queries() -> Optional[RequestQueries]:
+    return _current.get()
+
+
+@contextmanager
+def cache_maintenance():
+    """Запросы внутри блока обновляют кэши процесса (снимки справочника в памяти).
+
+    Они попадают в статистику запроса, но не в бюджет маршрута: перезагрузка
+    снимка случается редко и не зависит от маршрута, который на неё попал.
+    """
+    token = _maintenance.set(True)
+    try:
+        yield
+    finally:
+        _maintenance.reset(token)
+
+
+def query_budget(limit: int):
+    """Зависимость маршрута: собственный бюджет SQL-запросов вместо SQL_QUERY_BUDGET"""
+    async def set_budget() -> None:
+        queries = _current.get()
+        if queries is not None:
+            # Запросы middleware до маршрута (сверка версий кэша ответов) в бюджет маршрута не входят,
+            # как и запросы обновления кэшей внутри cache_maintenance()
+            queries.budget = queries.statements + limit
+    return Depends(set_budget)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Считать запросы движка в статистику текущего HTTP-запроса"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        queries = _current.get()
+        if queries is None:
+            return
+        if _maintenance.get():
+            # Бюджет сдвигается вместе со счётчиком, как для запросов middleware в query_budget
+            queries.budget += 1
+        elif settings.SQL_QUERY_BUDGET_ENFORCE and queries.statements >= queries.budget:
+            queries.rejected += 1
+            raise QueryBudgetExceeded(
+                f"Превышен бюджет SQL-запросов ({queries.budget}), следующий запрос: {statement[:200]}"
+            )
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        queries = _current.get()
+        started = conn.info.get("query_started")
+        if queries is None or not started:
+            return
+        queries.record(statement, time.perf_counter() - started.pop())
+
+
+def _server_timing(queries: RequestQueries, total: float) -> bytes:
+    return (
+        f'db;dur={queries.duration * 1000:.2f};desc="{queries.statements} queries", '
+        f"app;dur={total * 1000:.2f}"
+    ).encode()
+
+
+class QueryStatsMiddleware:
+    """Собирает SQL-статистику каждого запроса, отдаёт её в Server-Timing и пишет в лог одной строкой JSON"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(settings.SQL_QUERY_BUDGET)
+        token = _current.set(queries)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(queries, time.perf_counter() - started)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._log(scope, status, queries, time.perf_counter() - started)
+
+    @staticmethod
+    def _log(scope, status: int, queries: RequestQueries, total: float) -> None:
+        route = scope.get("route")
+        repeated = queries.repeated()
+        over_budget = queries.statements > queries.budget or queries.rejected > 0
+        level = logging.WARNING if repeated or over_budget else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            "event": "request_sql",
+            "method": scope["method"],
+            "route": getattr(route, "path", scope["path"]),
+            "status": status,
+            "duration_ms": round(total * 1000, 2),
+            "statements": queries.statements,
+            "db_ms": round(queries.duration * 1000, 2),
+            "budget": queries.budget,
+            "slowest": [
+                {"ms": round(duration * 1000, 2), "sql": statement[:200]}
+                for duration, statement in queries.slowest
+            ],
+        }
+        if over_budget:
+            record["over_budget"] = True
+        if repeated:
+            record["n_plus_one"] = [{"count": count, "sql": statement[:200]} for statement, count in repeated]
+        logger.log(level, json.dumps(record, ensure_ascii=False))
@@ -1,24 +1,64 @@
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import organizations, buildings
+from app.api import batch, organizations, buildings
+from app.config import settings
+from app.database import AsyncSessionLocal, dispose_engines
+from app.instrumentation import QueryStatsMiddleware
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, metrics
+from app.repositories.activity_repository import activity_taxonomy
+from app.response_cache import DataVersions, ResponseCacheMiddleware, create_backend
+from app.repositories.text_search import has_pg_trgm, organization_name_index, organization_prefix_index
+from app.services.geo_index import building_geo_index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Прогреваем кэши справочника до приёма запросов
+    async with AsyncSessionLocal() as db:
+        await activity_taxonomy.load(db)
+        await organization_prefix_index.load(db)
+        if settings.GEO_ENGINE == "memory":
+            await building_geo_index.load(db)
+        if not await has_pg_trgm(db):
+            await organization_name_index.load(db)
+    yield
+    await dispose_engines()
+
 
 app = FastAPI(
     description="REST API для справочника организаций, зданий и видов деятельности",
-
+    lifespan=lifespan,
 )
 
+if settings.RESPONSE_CACHE_ENABLED:
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        backend=create_backend(),
+        versions=DataVersions(settings.RESPONSE_CACHE_VERSION_TTL),
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "X-Total-Count-Estimate", "Server-Timing", "ETag", "X-Cache"],
 )
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Подключение роутеров
 app.include_router(organizations.router, prefix="/api/v1")
 app.include_router(buildings.router, prefix="/api/v1")
+app.include_router(batch.router, prefix="/api/v1")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Границы корзин гистограмм фиксированы: запрос только увеличивает пару счётчиков
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; счётчики по корзинам хранятся без накопления"""
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str, lines: List[str]) -> None:
+        cumulative = 0
+        separator = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+
+
+class RouteMetrics:
+    """Метрики одного маршрута: задержка, размер ответа и число ответов по классам статусов"""
+    __slots__ = ("path", "latency", "size", "statuses")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = [0] * 6
+
+
+class Metrics:
+    """Счётчики процесса в формате Prometheus.
+
+    Обновляются только из цикла событий (и из событий пула, которые SQLAlchemy
+    выполняет в нём же), поэтому обходятся без блокировок. Ключ - уже готовый
+    шаблон пути маршрута FastAPI, так что запрос не создаёт новых объектов.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, RouteMetrics] = {}
+        self.in_flight = 0
+        self.pool_wait = Histogram(POOL_WAIT_BUCKETS)
+        # Движки по именам ("primary", "replica1", ...); пул берётся при выдаче - dispose() его пересоздаёт
+        self.engines: Dict[str, object] = {}
+
+    def route(self, path: str) -> RouteMetrics:
+        metrics = self.routes.get(path)
+        if metrics is None:
+            metrics = self.routes[path] = RouteMetrics(path)
+        return metrics
+
+    def render(self) -> str:
+        lines: List[str] = []
+        lines.append("# HELP http_requests_in_flight Запросы в обработке")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        routes = sorted(self.routes.values(), key=lambda metrics: metrics.path)
+        lines.append("# HELP http_requests_total Ответы по маршрутам и классам статусов")
+        lines.append("# TYPE http_requests_total counter")
+        for metrics in routes:
+            for status_class, count in enumerate(metrics.statuses):
+                if count:
+                    lines.append(
+                        f'http_requests_total{{route="{metrics.path}",status="{status_class}xx"}} {count}'
+                    )
+        lines.append("# HELP http_request_duration_seconds Время обработки запроса")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for metrics in routes:
+            metrics.latency.render("http_request_duration_seconds", f'route="{metrics.path}"', lines)
+        lines.append("# HELP http_response_size_bytes Размер тела ответа")
+        lines.append("# TYPE http_response_size_bytes histogram")
+        for metrics in routes:
+            metrics.size.render("http_response_size_bytes", f'route="{metrics.path}"', lines)
+
+        pools = [(name, engine.pool) for name, engine in self.engines.items()]
+        for metric, description, value in (
+            ("db_pool_size", "Постоянных соединений в пуле", lambda pool: pool.size()),
+            ("db_pool_checked_out", "Соединений выдано запросам", lambda pool: pool.checkedout()),
+            ("db_pool_overflow", "Соединений сверх размера пула (отрицательно - свободные места)",
+             lambda pool: pool.overflow()),
+        ):
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, pool in pools:
+                lines.append(f'{metric}{{db="{name}"}} {value(pool)}')
+        lines.append("# HELP db_pool_wait_seconds Ожидание соединения из пула (все пулы)")
+        lines.append("# TYPE db_pool_wait_seconds histogram")
+        self.pool_wait.render("db_pool_wait_seconds", "", lines)
+        lines.append("")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет ожидание соединения (включая открытие нового) в metrics.pool_wait"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.pool_wait.observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Считает запросы в обработке, задержку, размер и статус ответа по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_stats(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            metrics.in_flight -= 1
+            # Запросы мимо маршрутов (404) считаются вместе, чтобы не плодить метки по произвольным путям
+            route_metrics = metrics.route(getattr(scope.get("route"), "path", "unmatched"))
+            route_metrics.latency.observe(time.perf_counter() - started)
+            route_metrics.size.observe(size)
+            route_metrics.statuses[min(status // 100, 5)] += 1
@@ -1,5 +1,6 @@
 from .organization import Organization, PhoneNumber
 from .building import Building
 from .activity import Activity
+from .data_version import DataVersion
 
-__all__ = ["Organization", "PhoneNumber", "Building", "Activity"]
+__all__ = ["Organization", "PhoneNumber", "Building", "Activity", "DataVersion"]
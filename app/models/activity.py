@@ -1,6 +1,20 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, event, inspect, select, delete, true
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.models.data_version import DIRECTORY_VERSION, mark_data_changed, track_data_version
+
+# Таблица замыканий дерева деятельностей: по строке на каждую пару (предок, потомок),
+# включая саму деятельность с depth = 0. Поддерживается событиями ниже.
+activity_closure = Table(
+    'activity_closure',
+    Base.metadata,
+    Column('ancestor_id', Integer, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True),
+    Column('descendant_id', Integer, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True, index=True),
+    Column('depth', Integer, nullable=False)
+)
+
+
+ACTIVITIES_VERSION = "activities"
 
 
 class Activity(Base):
@@ -10,7 +24,60 @@ class Activity(Base):
     name = Column(String(255), nullable=False, index=True)
     parent_id = Column(Integer, ForeignKey("activities.id"), nullable=True)
     level = Column(Integer, default=1, nullable=False)
-    
+
     parent = relationship("Activity", remote_side=[id], back_populates="children")
     children = relationship("Activity", back_populates="parent")
     organizations = relationship("Organization", secondary="organization_activities", back_populates="activities")
+
+
+def _link_to_parent(connection, activity_id: int, parent_id: int) -> None:
+    """Добавить связи всех предков parent_id со всем поддеревом activity_id"""
+    supertree = activity_closure.alias("supertree")
+    subtree = activity_closure.alias("subtree")
+    connection.execute(
+        activity_closure.insert().from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                supertree.c.ancestor_id,
+                subtree.c.descendant_id,
+                supertree.c.depth + subtree.c.depth + 1
+            )
+            .select_from(supertree.join(subtree, true()))
+            .where(supertree.c.descendant_id == parent_id)
+            .where(subtree.c.ancestor_id == activity_id)
+        )
+    )
+
+
+@event.listens_for(Activity, "after_insert")
+def _closure_after_insert(mapper, connection, target):
+    connection.execute(
+        activity_closure.insert().values(ancestor_id=target.id, descendant_id=target.id, depth=0)
+    )
+    if target.parent_id is not None:
+        _link_to_parent(connection, target.id, target.parent_id)
+    mark_data_changed(target, ACTIVITIES_VERSION)
+
+
+@event.listens_for(Activity, "after_update")
+def _closure_after_update(mapper, connection, target):
+    if not inspect(target).attrs.parent_id.history.has_changes():
+        return
+    mark_data_changed(target, ACTIVITIES_VERSION)
+    # Отрываем поддерево от старых предков и подвешиваем к новым
+    subtree_ids = select(activity_closure.c.descendant_id).where(activity_closure.c.ancestor_id == target.id)
+    connection.execute(
+        delete(activity_closure)
+        .where(activity_closure.c.descendant_id.in_(subtree_ids))
+        .where(activity_closure.c.ancestor_id.not_in(subtree_ids))
+    )
+    if target.parent_id is not None:
+        _link_to_parent(connection, target.id, target.parent_id)
+
+
+@event.listens_for(Activity, "after_delete")
+def _version_after_delete(mapper, connection, target):
+    mark_data_changed(target, ACTIVITIES_VERSION)
+
+
+track_data_version(Activity, DIRECTORY_VERSION)
@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, Float, Text
+from sqlalchemy import Column, Integer, Float, Text, Index, text
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.models.data_version import DIRECTORY_VERSION, track_data_version
+
+# Версия зданий: по ней перестраивается индекс координат в памяти процесса
+BUILDINGS_VERSION = "buildings"
 
 
 class Building(Base):
     __tablename__ = "buildings"
+    __table_args__ = (
+        # GiST по точке (долгота, широта) обслуживает поиск в прямоугольнике оператором <@
+        Index("ix_buildings_location", text("point(longitude, latitude)"), postgresql_using="gist"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     address = Column(Text, nullable=False, index=True)
@@ -12,3 +20,7 @@ class Building(Base):
     longitude = Column(Float, nullable=False)
     
     organizations = relationship("Organization", back_populates="building")
+
+
+track_data_version(Building, DIRECTORY_VERSION)
+track_data_version(Building, BUILDINGS_VERSION)
@@ -0,0 +1,67 @@
+from sqlalchemy import Column, String, BigInteger, event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, object_session
+from app.database import Base
+
+# Версия всего справочника: поднимается при любой записи в организации, телефоны, здания и деятельности
+DIRECTORY_VERSION = "directory"
+
+# Ключи session.info: изменённые наборы данных с последнего flush и уже поднятые в текущей транзакции
+_CHANGED = "data_versions_changed"
+_BUMPED = "data_versions_bumped"
+
+
+class DataVersion(Base):
+    """Счётчик версии набора данных: увеличивается при каждой записи в него"""
+    __tablename__ = "data_versions"
+
+    name = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+def bump_data_version(connection, name: str) -> None:
+    """Увеличить версию набора данных в текущей транзакции"""
+    statement = insert(DataVersion.__table__).values(name=name, version=1)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DataVersion.name],
+            set_={"version": DataVersion.__table__.c.version + 1}
+        )
+    )
+
+
+def mark_data_changed(target, name: str) -> None:
+    """Отметить, что запись target меняет набор данных name: версия поднимется после flush"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED, set()).add(name)
+
+
+def track_data_version(model, name: str) -> None:
+    """Поднимать версию набора данных при вставке, изменении и удалении строк модели через ORM"""
+    def mark(mapper, connection, target):
+        mark_data_changed(target, name)
+
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(model, event_name, mark)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_versions(session, flush_context):
+    # Одно увеличение на набор данных за транзакцию, а не на каждую строку: изменения транзакции
+    # становятся видны вместе при фиксации, так что для читателей это одна новая версия
+    changed = session.info.pop(_CHANGED, None)
+    if not changed:
+        return
+    bumped = session.info.setdefault(_BUMPED, set())
+    # Строки счётчиков блокируются в одном порядке во всех транзакциях, чтобы не было взаимных блокировок
+    for name in sorted(changed - bumped):
+        bump_data_version(session.connection(), name)
+    bumped |= changed
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_versions(session):
+    session.info.pop(_CHANGED, None)
+    session.info.pop(_BUMPED, None)
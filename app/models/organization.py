@@ -1,12 +1,16 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, Table
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.models.data_version import DIRECTORY_VERSION, track_data_version
+
+# Версия организаций: по ней перестраиваются индексы названий в памяти процесса
+ORGANIZATIONS_VERSION = "organizations"
 
 organization_activities = Table(
     'organization_activities',
     Base.metadata,
     Column('organization_id', Integer, ForeignKey('organizations.id'), primary_key=True),
-    Column('activity_id', Integer, ForeignKey('activities.id'), primary_key=True)
+    Column('activity_id', Integer, ForeignKey('activities.id'), primary_key=True, index=True)
 )
 
 
@@ -15,7 +19,7 @@ class Organization(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
-    building_id = Column(Integer, ForeignKey("buildings.id"), nullable=False)
+    building_id = Column(Integer, ForeignKey("buildings.id"), nullable=False, index=True)
     
     building = relationship("Building", back_populates="organizations")
     activities = relationship("Activity", secondary=organization_activities, back_populates="organizations")
@@ -27,6 +31,11 @@ class PhoneNumber(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), nullable=False)
-    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False, index=True)
     
     organization = relationship("Organization", back_populates="phone_numbers")
+
+
+track_data_version(Organization, DIRECTORY_VERSION)
+track_data_version(Organization, ORGANIZATIONS_VERSION)
+track_data_version(PhoneNumber, DIRECTORY_VERSION)
@@ -1,9 +1,61 @@
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
-from sqlalchemy import select
-from app.models.activity import Activity
+from sqlalchemy import event, select
+from app.config import settings
+from app.models.activity import Activity, activity_closure, ACTIVITIES_VERSION
 from app.repositories.base_repository import BaseRepository
+from app.repositories.versioned_snapshot import VersionedSnapshot
+
+
+class ActivityTaxonomy(VersionedSnapshot):
+    """Снимок дерева деятельностей в памяти процесса.
+
+    Дерево маленькое и почти не меняется, поэтому множества потомков каждой
+    деятельности считаются заранее. Актуальность проверяется по счётчику
+    data_versions не чаще раза в ACTIVITY_CACHE_TTL секунд.
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__(ACTIVITIES_VERSION, ttl)
+        self.descendants: Dict[int, FrozenSet[int]] = {}
+
+    async def _load(self, db: AsyncSession) -> None:
+        """Загрузить дерево целиком одним запросом"""
+        result = await db.execute(select(Activity.id, Activity.parent_id).order_by(Activity.id))
+        parents = dict(result.all())
+
+        children: Dict[Optional[int], List[int]] = {}
+        for activity_id, parent_id in parents.items():
+            children.setdefault(parent_id, []).append(activity_id)
+
+        descendants: Dict[int, FrozenSet[int]] = {}
+
+        def walk(activity_id: int) -> FrozenSet[int]:
+            subtree = {activity_id}
+            for child_id in children.get(activity_id, []):
+                subtree |= walk(child_id)
+            descendants[activity_id] = frozenset(subtree)
+            return descendants[activity_id]
+
+        for root_id in children.get(None, []):
+            walk(root_id)
+
+        self.descendants = descendants
+
+    def subtree_ids(self, activity_id: int) -> Optional[FrozenSet[int]]:
+        """ID активности и всех её потомков или None, если активность неизвестна"""
+        return self.descendants.get(activity_id)
+
+
+activity_taxonomy = ActivityTaxonomy(ttl=settings.ACTIVITY_CACHE_TTL)
+
+
+@event.listens_for(Activity, "after_insert")
+@event.listens_for(Activity, "after_update")
+@event.listens_for(Activity, "after_delete")
+def _invalidate_taxonomy(mapper, connection, target):
+    activity_taxonomy.invalidate()
 
 
 class ActivityRepository(BaseRepository[Activity]):
@@ -47,13 +99,29 @@ class ActivityRepository(BaseRepository[Activity]):
         )
         return result.scalars().all()
 
+    async def get_subtree_ids(self, activity_id: int) -> List[int]:
+        """Получить ID активности и всех её потомков"""
+        await activity_taxonomy.refresh(self.db)
+        subtree_ids = activity_taxonomy.subtree_ids(activity_id)
+        if subtree_ids is not None:
+            return list(subtree_ids)
+
+        # Активности ещё нет в снимке: спрашиваем таблицу замыканий
+        result = await self.db.execute(
+            select(activity_closure.c.descendant_id)
+            .filter(activity_closure.c.ancestor_id == activity_id)
+        )
+        return result.scalars().all()
+
     async def get_all_children_recursive(self, parent_id: int) -> List[Activity]:
         """Получить всех потомков активности"""
-        async def get_children_recursive(activity_id: int) -> List[Activity]:
-            children = await self.get_children(activity_id)
-            result = children.copy()
-            for child in children:
-                result.extend(await get_children_recursive(child.id))
-            return result
-        
-        return await get_children_recursive(parent_id)
+        result = await self.db.execute(
+            select(Activity)
+            .join(activity_closure, activity_closure.c.descendant_id == Activity.id)
+            .filter(
+                activity_closure.c.ancestor_id == parent_id,
+                activity_closure.c.depth > 0
+            )
+            .order_by(activity_closure.c.depth, Activity.id)
+        )
+        return result.scalars().all()
@@ -1,11 +1,50 @@
-from typing import TypeVar, Generic, List, Optional, Type
+from typing import Any, Dict, TypeVar, Generic, List, NamedTuple, Optional, Sequence, Type
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import ClauseElement, Executable, Integer, Select, any_, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
 from app.database import Base
+from app.repositories.text_search import has_pg_trgm
 
 ModelType = TypeVar("ModelType", bound=Base)
 
 
+class Page(NamedTuple):
+    """Страница выборки: записи, ключ сортировки последней записи (если есть ещё) и оценка общего числа"""
+    items: List[Any]
+    next_after: Optional[Any] = None
+    total: Optional[int] = None
+
+
+class Batch(NamedTuple):
+    """Записи по списку ID в порядке запроса и ID, которых не нашлось"""
+    items: List[Any]
+    missing: List[int]
+
+
+def contains(column, value: str):
+    """ILIKE по подстроке: %, _ и обратная косая черта из ввода пользователя ищутся буквально"""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def ordered_batch(ids: Sequence[int], found: Dict[int, Any]) -> Batch:
+    return Batch([found[id] for id in ids if id in found], [id for id in ids if id not in found])
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) для произвольного запроса с сохранением параметров"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
 class BaseRepository(Generic[ModelType]):
     def __init__(self, model: Type[ModelType], db: AsyncSession):
         self.model = model
@@ -15,10 +54,37 @@ class BaseRepository(Generic[ModelType]):
         result = await self.db.execute(select(self.model).filter(self.model.id == id))
         return result.scalar_one_or_none()
 
+    async def get_batch(self, ids: Sequence[int]) -> Batch:
+        """Записи по списку ID одним запросом (id = ANY(:ids))"""
+        result = await self.db.execute(
+            select(self.model).filter(self.model.id == any_(bindparam("ids", list(ids), type_=ARRAY(Integer))))
+        )
+        return ordered_batch(ids, {item.id: item for item in result.scalars()})
+
     async def get_all(self, skip: int = 0, limit: int = 100) -> List[ModelType]:
-        result = await self.db.execute(select(self.model).offset(skip).limit(limit))
+        result = await self.db.execute(select(self.model).order_by(self.model.id).offset(skip).limit(limit))
         return result.scalars().all()
 
+    async def get_page(self, after: Optional[int] = None, limit: int = 100) -> Page:
+        return await self.page(select(self.model), after, limit)
+
+    async def page(self, query: Select, after: Optional[int], limit: int) -> Page:
+        """Страница запроса по первичному ключу: next_after - ID последней записи, если есть следующая"""
+        query = query.order_by(self.model.id).limit(limit + 1)
+        if after is not None:
+            query = query.filter(self.model.id > after)
+        result = await self.db.execute(query)
+        items = result.scalars().all()
+        if len(items) > limit:
+            return Page(items[:limit], items[limit - 1].id)
+        return Page(items)
+
+    async def estimate_count(self, query: Select) -> int:
+        """Оценка числа строк запроса по плану (без выполнения самого запроса)"""
+        result = await self.db.execute(Explain(query.with_only_columns(self.model.id).order_by(None)))
+        plan = result.scalar_one()
+        return int(plan[0]["Plan"]["Plan Rows"])
+
     async def create(self, obj_in: dict) -> ModelType:
         db_obj = self.model(**obj_in)
         self.db.add(db_obj)
@@ -41,8 +107,17 @@ class BaseRepository(Generic[ModelType]):
             return True
         return False
 
-    async def search_by_name(self, name: str) -> List[ModelType]:
-        result = await self.db.execute(select(self.model).filter(
-            self.model.name.ilike(f"%{name}%")
-        ))
+    async def _similarity_order(self, column, value: str) -> list:
+        """Сортировка по похожести (pg_trgm), а без расширения - по ID"""
+        if await has_pg_trgm(self.db):
+            return [func.similarity(column, value).desc(), self.model.id]
+        return [self.model.id]
+
+    async def search_by_name(self, name: str, limit: int = 50) -> List[ModelType]:
+        result = await self.db.execute(
+            select(self.model)
+            .filter(contains(self.model.name, name))
+            .order_by(*await self._similarity_order(self.model.name, name))
+            .limit(limit)
+        )
         return result.scalars().all()
@@ -1,15 +1,22 @@
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from sqlalchemy import select
+from sqlalchemy import func, select
 from app.models.building import Building
-from app.repositories.base_repository import BaseRepository
+from app.repositories.base_repository import BaseRepository, contains
 
 
 class BuildingRepository(BaseRepository[Building]):
     def __init__(self, db: AsyncSession):
         super().__init__(Building, db)
 
+    @staticmethod
+    def in_rectangle(min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+        # Выражение совпадает с индексом ix_buildings_location, поэтому планировщик берёт GiST
+        return func.point(Building.longitude, Building.latitude).op("<@")(
+            func.box(func.point(min_lon, min_lat), func.point(max_lon, max_lat))
+        )
+
     async def get_with_organizations(self, id: int) -> Optional[Building]:
         result = await self.db.execute(
             select(Building)
@@ -33,8 +40,31 @@ class BuildingRepository(BaseRepository[Building]):
         )
         return result.scalars().all()
 
-    async def search_by_address(self, address: str) -> List[Building]:
+    async def search_by_address(self, address: str, limit: int = 50) -> List[Building]:
         result = await self.db.execute(
-            select(Building).filter(Building.address.ilike(f"%{address}%"))
+            select(Building)
+            .filter(contains(Building.address, address))
+            .order_by(*await self._similarity_order(Building.address, address))
+            .limit(limit)
         )
         return result.scalars().all()
+
+    async def get_clusters(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float, cell_size: float
+    ) -> List[dict]:
+        """Здания прямоугольника, сгруппированные по ячейкам сетки cell_size градусов (как geo.grid_cell):
+        центр масс, число зданий и наименьший id в каждой ячейке, по строкам и столбцам сетки"""
+        row = func.floor((Building.latitude + 90) / cell_size)
+        column = func.floor((Building.longitude + 180) / cell_size)
+        result = await self.db.execute(
+            select(
+                func.avg(Building.latitude).label("latitude"),
+                func.avg(Building.longitude).label("longitude"),
+                func.count().label("count"),
+                func.min(Building.id).label("sample_id"),
+            )
+            .filter(self.in_rectangle(min_lat, max_lat, min_lon, max_lon))
+            .group_by(row, column)
+            .order_by(row, column)
+        )
+        return [dict(row) for row in result.mappings()]
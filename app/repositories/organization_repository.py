@@ -1,118 +1,318 @@
-from typing import List, Optional
+import math
+from typing import AsyncIterator, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
-from sqlalchemy import and_, select
-from app.models.organization import Organization
+from sqlalchemy import JSON, Integer, Select, and_, any_, bindparam, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from app.config import settings
 from app.models.activity import Activity
+from app.models.organization import Organization, PhoneNumber, organization_activities
 from app.models.building import Building
-from app.repositories.base_repository import BaseRepository
+from app.repositories.base_repository import BaseRepository, Batch, Page, contains, ordered_batch
+from app.repositories.activity_repository import ActivityRepository
+from app.repositories.building_repository import BuildingRepository
+from app.repositories.text_search import has_pg_trgm, organization_name_index
+from app.geo import EARTH_RADIUS_M, bounding_box, haversine_m
+
+
+# Поля OrganizationResponse, которые можно запросить через fields, и связи для include
+ORGANIZATION_FIELDS = ("id", "name", "building_id", "phone_numbers", "activities")
+ORGANIZATION_INCLUDES = ("building",)
+
+
+class FieldSet(NamedTuple):
+    """Запрошенные поля ответа: fields=None - все ORGANIZATION_FIELDS; id выбирается всегда"""
+    fields: Optional[FrozenSet[str]] = None
+    include: FrozenSet[str] = frozenset()
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields is None and not self.include
+
+    def wants(self, name: str) -> bool:
+        if name in self.include or name == "id":
+            return True
+        return name in ORGANIZATION_FIELDS if self.fields is None else name in self.fields
+
+
+DEFAULT_FIELDSET = FieldSet()
 
 
 class OrganizationRepository(BaseRepository[Organization]):
     def __init__(self, db: AsyncSession):
         super().__init__(Organization, db)
 
-    async def get_with_details(self, id: int) -> Optional[Organization]:
+    @staticmethod
+    def page_size(limit: Optional[int]) -> int:
+        return min(limit or settings.DEFAULT_PAGE_SIZE, settings.MAX_PAGE_SIZE)
+
+    @staticmethod
+    def _json_list(query: Select, *fields) -> Select:
+        """Подзапрос: JSON-массив объектов {поле: значение} по строкам query, упорядоченный по первому полю"""
+        item = func.json_build_object(*[part for field in fields for part in (field.key, field)])
+        aggregated = func.json_agg(aggregate_order_by(item, fields[0]))
+        return query.with_only_columns(
+            func.coalesce(aggregated, literal_column("'[]'::json"), type_=JSON)
+        ).scalar_subquery()
+
+    @classmethod
+    def _details_columns(cls, fieldset: FieldSet = DEFAULT_FIELDSET) -> list:
+        """Колонки запрошенных полей ответа: связи собираются в JSON на стороне БД, лишние не выбираются"""
+        columns = [Organization.id]
+        if fieldset.wants("name"):
+            columns.append(Organization.name)
+        if fieldset.wants("building_id"):
+            columns.append(Organization.building_id)
+        if fieldset.wants("phone_numbers"):
+            columns.append(cls._json_list(
+                select(PhoneNumber.id).filter(PhoneNumber.organization_id == Organization.id),
+                PhoneNumber.id, PhoneNumber.number
+            ).label("phone_numbers"))
+        if fieldset.wants("activities"):
+            columns.append(cls._json_list(
+                select(Activity.id)
+                .join(organization_activities, organization_activities.c.activity_id == Activity.id)
+                .filter(organization_activities.c.organization_id == Organization.id),
+                Activity.id, Activity.name
+            ).label("activities"))
+        if fieldset.wants("building"):
+            building = func.json_build_object(
+                "id", Building.id, "address", Building.address,
+                "latitude", Building.latitude, "longitude", Building.longitude,
+                type_=JSON
+            )
+            columns.append(
+                select(building)
+                .filter(Building.id == Organization.building_id)
+                .correlate_except(Building)
+                .scalar_subquery()
+                .label("building")
+            )
+        return columns
+
+    def project(self, query: Select, fieldset: FieldSet = DEFAULT_FIELDSET) -> Select:
+        """Тот же запрос-фильтр, но только с колонками запрошенных полей, без ORM-объектов"""
+        return query.with_only_columns(*self._details_columns(fieldset))
+
+    @staticmethod
+    def _loader_options(fieldset: FieldSet) -> list:
+        """Загрузчики связей только для запрошенных полей: остальные не стоят ни одного запроса"""
+        options = []
+        if fieldset.wants("building"):
+            options.append(joinedload(Organization.building))
+        if fieldset.wants("activities"):
+            options.append(selectinload(Organization.activities))
+        if fieldset.wants("phone_numbers"):
+            options.append(selectinload(Organization.phone_numbers))
+        return options
+
+    async def get_with_details(self, id: int, fieldset: FieldSet = DEFAULT_FIELDSET) -> Optional[Organization]:
         result = await self.db.execute(
             select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
+            .options(*self._loader_options(fieldset))
             .filter(Organization.id == id)
         )
         return result.scalar_one_or_none()
 
-    async def get_by_building(self, building_id: int) -> List[Organization]:
-        result = await self.db.execute(
-            select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
-            .filter(Organization.building_id == building_id)
+    # Запросы-фильтры: общие для постраничной выдачи и оценки общего числа
+
+    def query_by_building(self, building_id: int) -> Select:
+        return select(Organization).filter(Organization.building_id == building_id)
+
+    def query_by_buildings(self, building_ids: List[int]) -> Select:
+        # Один параметр-массив вместо IN со списком: список зданий может быть длинным
+        return select(Organization).filter(
+            Organization.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer)))
         )
-        return result.scalars().all()
 
-    async def get_by_activity(self, activity_id: int) -> List[Organization]:
-        result = await self.db.execute(
-            select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
-            .filter(Organization.activities.any(id=activity_id))
+    def query_by_activity(self, activity_id: int) -> Select:
+        return select(Organization).filter(Organization.activities.any(id=activity_id))
+
+    @staticmethod
+    def _has_any_activity(activity_ids: List[int]):
+        return Organization.id.in_(
+            select(organization_activities.c.organization_id)
+            .filter(organization_activities.c.activity_id == any_(bindparam("activity_ids", activity_ids, type_=ARRAY(Integer))))
         )
-        return result.scalars().all()
-
-    async def get_by_activity_tree(self, activity_id: int) -> List[Organization]:
-        async def get_all_children(activity_id: int) -> List[int]:
-            result = await self.db.execute(select(Activity.id).filter(Activity.parent_id == activity_id))
-            children = result.scalars().all()
-            result_ids = [activity_id]
-            for child in children:
-                result_ids.extend(await get_all_children(child))
-            return result_ids
-        
-        activity_ids = await get_all_children(activity_id)
-        
-        result = await self.db.execute(
+
+    async def query_by_activity_tree(self, activity_id: int) -> Optional[Select]:
+        """Запрос по поддереву деятельности или None, если такой деятельности нет"""
+        activity_ids = await ActivityRepository(self.db).get_subtree_ids(activity_id)
+        if not activity_ids:
+            return None
+        return select(Organization).filter(self._has_any_activity(activity_ids))
+
+    _in_rectangle = staticmethod(BuildingRepository.in_rectangle)
+
+    def query_in_rectangle(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> Select:
+        return (
             select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
-            .filter(Organization.activities.any(Activity.id.in_(activity_ids)))
+            .join(Organization.building)
+            .filter(self._in_rectangle(min_lat, max_lat, min_lon, max_lon))
         )
-        return result.scalars().all()
 
-    async def get_in_rectangle(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> List[Organization]:
-        
-        result = await self.db.execute(
-            select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
+    @staticmethod
+    def _distance_m(lat: float, lon: float):
+        """Расстояние от точки до здания в метрах (гаверсинус, как geo.haversine_m) на стороне БД"""
+        half_d_phi = func.radians(Building.latitude - lat) / 2
+        half_d_lambda = func.radians(Building.longitude - lon) / 2
+        a = (
+            func.power(func.sin(half_d_phi), 2)
+            + math.cos(math.radians(lat)) * func.cos(func.radians(Building.latitude))
+            * func.power(func.sin(half_d_lambda), 2)
+        )
+        return 2 * EARTH_RADIUS_M * func.asin(func.least(1.0, func.sqrt(a)))
+
+    def query_search(
+        self, activity_ids: Optional[List[int]] = None,
+        rectangle: Optional[Tuple[float, float, float, float]] = None,
+        circle: Optional[Tuple[float, float, float]] = None,
+        building_ids: Optional[List[int]] = None, name: Optional[str] = None
+    ) -> Select:
+        """Пересечение фильтров одним запросом: поддерево деятельности (activity_ids), прямоугольник
+        (min_lat, max_lat, min_lon, max_lon), круг (lat, lon, radius_m), здания и подстрока названия.
+
+        Условия те же, что в одиночных запросах-фильтрах, поэтому каждое может обслужить свой индекс,
+        а каким из них начинать план, планировщик выбирает по статистике.
+        """
+        query = select(Organization)
+        if activity_ids is not None:
+            query = query.filter(self._has_any_activity(activity_ids))
+        if building_ids is not None:
+            query = query.filter(
+                Organization.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer)))
             )
-            .join(Organization.building)
-            .filter(
-                and_(
-                    Building.latitude >= min_lat,
-                    Building.latitude <= max_lat,
-                    Building.longitude >= min_lon,
-                    Building.longitude <= max_lon
-                )
+        if rectangle is not None or circle is not None:
+            query = query.join(Organization.building)
+        if rectangle is not None:
+            query = query.filter(self._in_rectangle(*rectangle))
+        if circle is not None:
+            lat, lon, radius_m = circle
+            # Прямоугольник вокруг круга идёт по GiST, точное расстояние проверяется только для попавших в него
+            query = query.filter(
+                self._in_rectangle(*bounding_box(lat, lon, radius_m)), self._distance_m(lat, lon) <= radius_m
             )
+        if name is not None:
+            query = query.filter(contains(Organization.name, name))
+        return query
+
+    async def get_page_with_details(
+        self, query: Select, after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        """Страница запроса-фильтра словарями с запрошенными полями, не больше MAX_PAGE_SIZE записей"""
+        limit = self.page_size(limit)
+        projected = self.project(query, fieldset).order_by(Organization.id).limit(limit + 1)
+        if after is not None:
+            projected = projected.filter(Organization.id > after)
+        result = await self.db.execute(projected)
+        rows = [dict(row) for row in result.mappings()]
+        page = Page(rows[:limit], rows[limit - 1]["id"] if len(rows) > limit else None)
+        if with_total:
+            page = page._replace(total=await self.estimate_count(query))
+        return page
+
+    async def stream_with_details(
+        self, batch_size: int, fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> AsyncIterator[List[dict]]:
+        """Все организации пачками по batch_size через серверный курсор, в порядке id"""
+        result = await self.db.stream(
+            self.project(select(Organization), fieldset)
+            .order_by(Organization.id)
+            .execution_options(yield_per=batch_size)
         )
-        return result.scalars().all()
+        async for rows in result.mappings().partitions():
+            yield [dict(row) for row in rows]
 
-    async def get_all_with_details(self, skip: int = 0, limit: int = 100) -> List[Organization]:
-        
-        result = await self.db.execute(
-            select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
-            .offset(skip)
-            .limit(limit)
+    async def get_nearby_ids(
+        self, lat: float, lon: float, radius_m: float, activity_ids: Optional[List[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Пары (id организации, расстояние в метрах) в радиусе без загрузки связей, ближайшие первыми"""
+        # Индексируемый прямоугольник отсекает кандидатов, точное расстояние считаем по ним
+        query = (
+            select(Organization.id, Building.latitude, Building.longitude)
+            .join(Organization.building)
+            .filter(self._in_rectangle(*bounding_box(lat, lon, radius_m)))
         )
-        return result.scalars().all()
+        if activity_ids is not None:
+            query = query.filter(self._has_any_activity(activity_ids))
+        result = await self.db.execute(query)
 
-    async def search_by_name(self, name: str) -> List[Organization]:
+        matches = []
+        for organization_id, building_lat, building_lon in result.all():
+            distance = haversine_m(lat, lon, building_lat, building_lon)
+            if distance <= radius_m:
+                matches.append((organization_id, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    async def get_ids_by_buildings(
+        self, building_ids: List[int], activity_ids: Optional[List[int]] = None
+    ) -> List[Tuple[int, int]]:
+        """Пары (id организации, id здания) для указанных зданий без загрузки связей"""
+        query = (
+            select(Organization.id, Organization.building_id)
+            .filter(Organization.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer))))
+        )
+        if activity_ids is not None:
+            query = query.filter(self._has_any_activity(activity_ids))
+        result = await self.db.execute(query)
+        return result.all()
+
+    async def get_by_ids(self, ids: List[int], fieldset: FieldSet = DEFAULT_FIELDSET) -> List[dict]:
+        """Организации словарями с запрошенными полями, порядок не гарантируется"""
         result = await self.db.execute(
-            select(Organization)
-            .options(
-                joinedload(Organization.building),
-                selectinload(Organization.activities),
-                selectinload(Organization.phone_numbers)
-            )
-            .filter(Organization.name.ilike(f"%{name}%"))
+            self.project(select(Organization), fieldset)
+            .filter(Organization.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
         )
-        return result.scalars().all()
+        return [dict(row) for row in result.mappings()]
+
+    async def get_batch_with_details(self, ids: Sequence[int], fieldset: FieldSet = DEFAULT_FIELDSET) -> Batch:
+        """Организации словарями в порядке ids и отсутствующие ID - одним запросом"""
+        organizations = await self.get_by_ids(list(ids), fieldset)
+        return ordered_batch(ids, {org["id"]: org for org in organizations})
+
+    def query_by_name(self, name: str) -> Select:
+        # ILIKE по подстроке обслуживает GIN-индекс ix_organizations_name_trgm
+        return select(Organization).filter(contains(Organization.name, name))
+
+    async def search_by_name(
+        self, name: str, after: Optional[Tuple[float, int]] = None, limit: Optional[int] = None,
+        with_total: bool = False, fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        """Поиск по подстроке, наиболее похожие первыми; next_after - пара (похожесть, id)"""
+        limit = self.page_size(limit)
+        if not await has_pg_trgm(self.db):
+            await organization_name_index.refresh(self.db)
+            ranked = organization_name_index.search(name, after, limit + 1)
+            scores = dict(ranked)
+            organizations = await self.get_by_ids(list(scores), fieldset)
+            organizations.sort(key=lambda org: (-scores[org["id"]], org["id"]))
+            next_after = None
+            if len(organizations) > limit:
+                organizations = organizations[:limit]
+                next_after = (scores[organizations[-1]["id"]], organizations[-1]["id"])
+            total = organization_name_index.count(name) if with_total else None
+            return Page(organizations, next_after, total)
+
+        query = self.query_by_name(name)
+        score = func.similarity(Organization.name, name)
+        ranked_query = (
+            self.project(query, fieldset)
+            .add_columns(score.label("score"))
+            .order_by(score.desc(), Organization.id)
+        )
+        if after is not None:
+            after_score, after_id = after
+            ranked_query = ranked_query.filter(or_(score < after_score, and_(score == after_score, Organization.id > after_id)))
+        result = await self.db.execute(ranked_query.limit(limit + 1))
+        rows = [dict(row) for row in result.mappings()]
+
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = (float(rows[-1]["score"]), rows[-1]["id"])
+        for row in rows:
+            del row["score"]
+        total = await self.estimate_count(query) if with_total else None
+        return Page(rows, next_after, total)
@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.organization import ORGANIZATIONS_VERSION, Organization
+from app.repositories.versioned_snapshot import VersionedSnapshot
+
+_pg_trgm_available: Optional[bool] = None
+
+
+async def has_pg_trgm(db: AsyncSession) -> bool:
+    """Установлено ли в БД расширение pg_trgm (проверяется один раз на процесс)"""
+    global _pg_trgm_available
+    if _pg_trgm_available is None:
+        result = await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+        _pg_trgm_available = result.scalar_one_or_none() is not None
+    return _pg_trgm_available
+
+
+_WORD = re.compile(r"\w+")
+
+# Сколько ключей индекса подсказок сортируется одним вызовом sorted() при построении
+_SORT_CHUNK = 20000
+
+
+def trigrams(value: str) -> Set[str]:
+    """Триграммы строки так же, как их строит pg_trgm: по словам, с отступами"""
+    grams = set()
+    for word in _WORD.findall(value.casefold()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NgramIndex(VersionedSnapshot):
+    """Триграммный индекс названий в памяти процесса.
+
+    Запасной вариант поиска по подстроке для БД без pg_trgm: кандидаты берутся
+    пересечением списков по триграммам запроса, проверяются на вхождение
+    подстроки и ранжируются по похожести так же, как similarity() в pg_trgm.
+    Перестраивается целиком при смене версии организаций: в потоке пула, с
+    подменой одним присваиванием, пока запросы обслуживает прежний индекс.
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__(ORGANIZATIONS_VERSION, ttl)
+        self._names: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = {}
+
+    @staticmethod
+    def _build(rows: Sequence[Tuple[int, str]]) -> Tuple[Dict[int, str], Dict[str, Set[int]]]:
+        names = dict(rows)
+        postings: Dict[str, Set[int]] = {}
+        for id, name in names.items():
+            for gram in trigrams(name):
+                postings.setdefault(gram, set()).add(id)
+        return names, postings
+
+    async def _load(self, db: AsyncSession) -> None:
+        result = await db.execute(select(Organization.id, Organization.name))
+        self._names, self._postings = await asyncio.get_running_loop().run_in_executor(
+            None, self._build, result.all()
+        )
+
+    def _ranked(self, query: str) -> List[Tuple[float, int]]:
+        needle = query.casefold()
+        # Триграммы внутри слов запроса без отступов: они есть у любого вхождения подстроки
+        inner = set()
+        for word in _WORD.findall(needle):
+            inner.update(word[i:i + 3] for i in range(len(word) - 2))
+
+        if inner:
+            candidates = None
+            for gram in sorted(inner, key=lambda gram: len(self._postings.get(gram, ()))):
+                postings = self._postings.get(gram, set())
+                candidates = postings.copy() if candidates is None else candidates & postings
+                if not candidates:
+                    return []
+        else:
+            candidates = self._names.keys()
+
+        query_grams = trigrams(query)
+        ranked = []
+        for id in candidates:
+            name = self._names[id]
+            if needle in name.casefold():
+                name_grams = trigrams(name)
+                union = len(query_grams | name_grams)
+                score = len(query_grams & name_grams) / union if union else 0.0
+                ranked.append((-score, id))
+        ranked.sort()
+        return ranked
+
+    def search(self, query: str, after: Optional[Tuple[float, int]], limit: int) -> List[Tuple[int, float]]:
+        """Пары (id, похожесть) записей, содержащих query, в порядке убывания похожести"""
+        ranked = self._ranked(query)
+        start = 0
+        if after is not None:
+            start = bisect_right(ranked, (-after[0], after[1]))
+        return [(id, -score) for score, id in ranked[start:start + limit]]
+
+    def count(self, query: str) -> int:
+        return len(self._ranked(query))
+
+
+class PrefixIndex(VersionedSnapshot):
+    """Отсортированный массив (ключ, id) для подсказок по началу названия.
+
+    Ключи - название в casefold и его хвосты с начала каждого слова, чтобы
+    'мол' находил 'ООО "Молоко"'. Поиск - бинарный поиск по массиву.
+    Перестраивается целиком при смене версии организаций, как NgramIndex.
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__(ORGANIZATIONS_VERSION, ttl)
+        self._entries: List[Tuple[str, int]] = []
+        self._names: Dict[int, str] = {}
+
+    @staticmethod
+    def _keys(name: str) -> Set[str]:
+        folded = name.casefold()
+        return {folded} | {folded[match.start():] for match in _WORD.finditer(folded)}
+
+    @classmethod
+    def _build(cls, rows: Sequence[Tuple[int, str]]) -> Tuple[List[Tuple[str, int]], Dict[int, str]]:
+        names = dict(rows)
+        entries = [(key, id) for id, name in names.items() for key in cls._keys(name)]
+        # Кусками и слиянием: один sorted() на весь массив держал бы GIL и останавливал цикл событий
+        chunks = [sorted(entries[i:i + _SORT_CHUNK]) for i in range(0, len(entries), _SORT_CHUNK)]
+        return list(heapq.merge(*chunks)), names
+
+    async def _load(self, db: AsyncSession) -> None:
+        result = await db.execute(select(Organization.id, Organization.name))
+        self._entries, self._names = await asyncio.get_running_loop().run_in_executor(
+            None, self._build, result.all()
+        )
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        """Пары (id, название) с началом слова на prefix, в алфавитном порядке ключей"""
+        needle = prefix.casefold()
+        found: Dict[int, str] = {}
+        position = bisect_left(self._entries, (needle,))
+        while position < len(self._entries) and len(found) < limit:
+            key, id = self._entries[position]
+            if not key.startswith(needle):
+                break
+            found.setdefault(id, self._names[id])
+            position += 1
+        return list(found.items())
+
+
+organization_name_index = NgramIndex(ttl=settings.NAME_INDEX_TTL)
+organization_prefix_index = PrefixIndex(ttl=settings.NAME_INDEX_TTL)
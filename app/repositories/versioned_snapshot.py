@@ -0,0 +1,96 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.instrumentation import cache_maintenance
+from app.models.data_version import DataVersion
+
+# Ключ session.info: версии, прочитанные сессией запроса для кэша ответов (fetch_data_versions)
+_READ = "data_versions_read"
+
+
+async def fetch_data_version(db: AsyncSession, name: str) -> int:
+    result = await db.execute(select(DataVersion.version).filter(DataVersion.name == name))
+    return result.scalar_one_or_none() or 0
+
+
+async def fetch_data_versions(db: AsyncSession) -> str:
+    """Версии всех наборов данных одной строкой "имя=версия,..." в порядке имён.
+
+    Версии запоминаются в сессии: снимки в памяти, к которым она обращается,
+    догоняют их до ответа (VersionedSnapshot.refresh).
+    """
+    result = await db.execute(select(DataVersion.name, DataVersion.version).order_by(DataVersion.name))
+    versions = dict(result.all())
+    db.info[_READ] = versions
+    return ",".join(f"{name}={version}" for name, version in versions.items())
+
+
+def session_data_versions(db: AsyncSession) -> Dict[str, int]:
+    """Версии, прочитанные в сессии через fetch_data_versions (пусто, если не читались)"""
+    return db.info.get(_READ, {})
+
+
+class VersionedSnapshot(ABC):
+    """Снимок набора данных в памяти процесса, привязанный к его версии в data_versions.
+
+    Версия сверяется с БД не чаще раза в ttl секунд; если она изменилась (запись
+    через ORM в любом процессе или bulk_load), снимок строится заново, а
+    запросы тем временем обслуживает прежний. Если
+    сессия запроса уже видела более новую версию (ключ кэша ответов), снимок
+    перезагружается сразу, не дожидаясь ttl: иначе ответ по старому снимку
+    лёг бы в кэш под новыми версиями. Запросы сверки и загрузки не входят
+    в бюджет маршрута (cache_maintenance).
+    """
+
+    def __init__(self, version_name: str, ttl: float):
+        self.version_name = version_name
+        self.ttl = ttl
+        self.version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def invalidate(self) -> None:
+        """Сверить версию с БД при следующем обращении"""
+        self._checked_at = 0.0
+
+    @abstractmethod
+    async def _load(self, db: AsyncSession) -> None:
+        """Построить снимок заново по текущим данным"""
+
+    async def load(self, db: AsyncSession) -> None:
+        # Версия читается до данных: снимок не старше версии, под которой он записан
+        version = await fetch_data_version(db, self.version_name)
+        await self._load(db)
+        self.version = version
+        self._checked_at = time.monotonic()
+
+    def _behind(self, db: AsyncSession) -> bool:
+        """Сессия запроса уже видела версию новее снимка"""
+        seen = session_data_versions(db).get(self.version_name)
+        return seen is not None and seen > self.version
+
+    def _fresh(self, db: AsyncSession) -> bool:
+        return self.loaded and not self._behind(db) and time.monotonic() - self._checked_at < self.ttl
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Перезагрузить снимок, если версия в БД изменилась"""
+        if self._fresh(db):
+            return
+        if self.loaded and self._lock.locked() and not self._behind(db):
+            # Снимок уже сверяет или перестраивает другой запрос: до замены отвечаем по текущему
+            return
+        async with self._lock:
+            if self._fresh(db):
+                return
+            with cache_maintenance():
+                if self.loaded and await fetch_data_version(db, self.version_name) == self.version:
+                    self._checked_at = time.monotonic()
+                    return
+                await self.load(db)
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import json
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+from starlette.datastructures import Headers
+from app.api.dependencies import CONSISTENCY_HEADER
+from app.config import settings
+from app.database import session_scope
+from app.repositories.versioned_snapshot import fetch_data_versions
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    etag: bytes
+    route: str
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class ResponseCacheBackend(ABC):
+    """Хранилище ответов; методы асинхронные, чтобы за ним мог стоять общий для процессов кэш"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        """Ответ по ключу или None, если его нет или он устарел"""
+
+    @abstractmethod
+    async def set(self, key: str, response: CachedResponse) -> None:
+        """Сохранить ответ под ключом"""
+
+
+class MemoryResponseCache(ResponseCacheBackend):
+    """LRU в памяти процесса с ограничением по числу записей, суммарному размеру и времени жизни"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def set(self, key: str, response: CachedResponse) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self.bytes += response.size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, response = self._entries.pop(key)
+        self.bytes -= response.size
+
+
+class RedisResponseCache(ResponseCacheBackend):
+    """Общий для процессов кэш в Redis (нужен пакет redis); вытеснением занимается сам Redis"""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            from redis import asyncio as redis
+        except ImportError as error:
+            raise RuntimeError("Для RESPONSE_CACHE_BACKEND=redis установите пакет redis") from error
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        value = await self.client.get(f"response:{key}")
+        if value is None:
+            return None
+        meta, body = value.split(b"\n", 1)
+        status, headers, etag, route = json.loads(meta)
+        return CachedResponse(
+            status, [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers], body,
+            etag.encode("latin-1"), route
+        )
+
+    async def set(self, key: str, response: CachedResponse) -> None:
+        meta = json.dumps([
+            response.status,
+            [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.headers],
+            response.etag.decode("latin-1"),
+            response.route,
+        ])
+        await self.client.set(f"response:{key}", meta.encode() + b"\n" + response.body, px=int(self.ttl * 1000))
+
+
+class DataVersions:
+    """Версии наборов данных из data_versions одной строкой; с БД сверяются не чаще раза в ttl секунд"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.value: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self.value is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def current(self, primary: bool = False) -> str:
+        if self._fresh():
+            return self.value
+        async with self._lock:
+            if not self._fresh():
+                async with session_scope(primary=primary) as db:
+                    self.value = await fetch_data_versions(db)
+                self._checked_at = time.monotonic()
+        return self.value
+
+
+def create_backend() -> ResponseCacheBackend:
+    if settings.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisResponseCache(settings.RESPONSE_CACHE_REDIS_URL, settings.RESPONSE_CACHE_TTL)
+    return MemoryResponseCache(
+        settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_TTL
+    )
+
+
+def _etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    tag = etag.decode()
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+class ResponseCacheMiddleware:
+    """Кэш GET-ответов API со строгими ETag.
+
+    Ключ - версии данных из data_versions, хост, путь и отсортированные
+    параметры запроса, поэтому любая запись в справочник (поднимающая версию)
+    делает старые записи недостижимыми, и они вытесняются. Для поиска версии
+    берутся из DataVersions, а ответ сохраняется под версиями, которые
+    get_current_db прочитал в сессии самого запроса до его данных: реплика,
+    отдавшая данные, не может оказаться позади версий в ключе. Маршруты без
+    такой сессии и отвечающие из индексов в памяти (bypass_response_cache)
+    не сохраняются.
+
+    Кэшируются только ответы 200 одним телом (потоковая выгрузка - нет) не
+    больше RESPONSE_CACHE_MAX_ENTRY_BYTES. Совпавший If-None-Match даёт 304;
+    при попадании в кэш запрос не доходит до маршрута и БД. Запросы без
+    верного API-ключа и с X-Consistency: primary идут мимо кэша.
+    """
+
+    def __init__(self, app, backend: ResponseCacheBackend, versions: DataVersions, prefix: str = "/api/"):
+        self.app = app
+        self.backend = backend
+        self.versions = versions
+        self.prefix = prefix
+        # Маршруты по шаблону пути: при попадании в кэш их видят метрики и SQL-статистика снаружи
+        self._routes = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if headers.get("x-api-key") != settings.API_KEY or headers.get(CONSISTENCY_HEADER) == "primary":
+            await self.app(scope, receive, send)
+            return
+
+        query = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+        request_key = f'{headers.get("host", "")}|{scope["path"]}?{query}'
+        cached = await self.backend.get(f"{await self.versions.current()}|{request_key}")
+        if cached is not None:
+            route = self._routes.get(cached.route)
+            if route is not None:
+                scope["route"] = route
+            await self._send(cached, headers, send, b"HIT")
+            return
+
+        # Просьба к get_current_db прочитать версии в сессии запроса (request.state.data_versions)
+        state = scope.setdefault("state", {})
+        state["response_cache"] = True
+        start = None
+        passthrough = False
+
+        async def capture(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                versions = state.get("data_versions") if state.get("response_cache") else None
+                cacheable = versions is not None and start["status"] == 200 and not message.get("more_body")
+                if not cacheable or len(body) > settings.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                route = scope.get("route")
+                path = getattr(route, "path", "")
+                self._routes[path] = route
+                response = CachedResponse(start["status"], list(start.get("headers", [])), body, _etag(body), path)
+                await self.backend.set(f"{versions}|{request_key}", response)
+                await self._send(response, headers, send, b"MISS")
+
+        await self.app(scope, receive, capture)
+
+    @staticmethod
+    async def _send(response: CachedResponse, request_headers: Headers, send, state: bytes) -> None:
+        if _etag_matches(request_headers.get("if-none-match"), response.etag):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", response.etag), (b"x-cache", state)],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({
+            "type": "http.response.start",
+            "status": response.status,
+            "headers": response.headers + [(b"etag", response.etag), (b"x-cache", state)],
+        })
+        await send({"type": "http.response.body", "body": response.body})
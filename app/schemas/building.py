@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List
 
 
 class BuildingBase(BaseModel):
@@ -11,3 +12,15 @@ class BuildingResponse(BuildingBase):
     id: int
 
     model_config = {"from_attributes": True}
+
+
+class BuildingBatchResponse(BaseModel):
+    items: List[BuildingResponse] = Field(..., description="Найденные здания в порядке запроса")
+    missing: List[int] = Field(..., description="ID, которых нет в справочнике")
+
+
+class BuildingClusterResponse(BaseModel):
+    latitude: float = Field(..., description="Центр масс зданий ячейки")
+    longitude: float
+    count: int = Field(..., description="Число зданий в ячейке")
+    sample_id: int = Field(..., description="ID одного из зданий ячейки (наименьший)")
@@ -29,9 +29,23 @@ class OrganizationListResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class OrganizationSuggestionResponse(BaseModel):
+    id: int
+    name: str
+
+
 class OrganizationResponse(OrganizationBase):
     id: int
     phone_numbers: List[PhoneNumberResponse] = []
     activities: List[ActivitySimpleResponse] = []
 
     model_config = {"from_attributes": True}
+
+
+class OrganizationWithDistanceResponse(OrganizationResponse):
+    distance_m: float = Field(..., description="Расстояние до точки поиска в метрах")
+
+
+class OrganizationBatchResponse(BaseModel):
+    items: List[OrganizationResponse] = Field(..., description="Найденные организации в порядке запроса")
+    missing: List[int] = Field(..., description="ID, которых нет в справочнике")
@@ -1,3 +1,4 @@
+from .building_service import BuildingService
 from .organization_service import OrganizationService
 
-__all__ = ["OrganizationService"]
+__all__ = ["BuildingService", "OrganizationService"]
@@ -0,0 +1,22 @@
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.repositories.building_repository import BuildingRepository
+from app.services.geo_index import building_geo_index
+from app.services.single_flight import single_flight
+
+
+class BuildingService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.building_repo = BuildingRepository(db)
+
+    @single_flight()
+    async def get_clusters(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float, cell_size: float
+    ) -> List[dict]:
+        """Здания прямоугольника по ячейкам сетки: центр, число зданий и наименьший id в каждой"""
+        if settings.GEO_ENGINE == "memory":
+            await building_geo_index.refresh(self.db)
+            return building_geo_index.clusters(min_lat, max_lat, min_lon, max_lon, cell_size)
+        return await self.building_repo.get_clusters(min_lat, max_lat, min_lon, max_lon, cell_size)
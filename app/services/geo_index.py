@@ -0,0 +1,151 @@
+import asyncio
+import math
+from array import array
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.geo import bounding_box, grid_cell, haversine_m
+from app.models.building import BUILDINGS_VERSION, Building
+from app.repositories.versioned_snapshot import VersionedSnapshot
+
+
+class BuildingGeoIndex(VersionedSnapshot):
+    """Снимок координат всех зданий в памяти процесса.
+
+    Точки лежат в трёх плоских массивах (id, широта, долгота), сгруппированных
+    по ячейке сетки размером cell_size градусов; для каждой непустой ячейки
+    хранится диапазон в массивах. Прямоугольник и круг обходят только
+    пересекаемые ячейки.
+
+    Любое изменение зданий (добавление, перенос, удаление) поднимает версию
+    buildings, и при следующей сверке индекс строится заново целиком: строки
+    читаются из БД, а сетка строится в потоке пула, чтобы не
+    останавливать цикл событий. Готовые массивы подменяются одним
+    присваиванием, до этого запросы обслуживает прежняя сетка.
+    """
+
+    def __init__(self, cell_size: float, refresh_interval: float):
+        super().__init__(BUILDINGS_VERSION, refresh_interval)
+        self.cell_size = cell_size
+        self._columns = math.ceil(360 / cell_size) + 1
+        self._rows = math.ceil(180 / cell_size) + 1
+        self._ids = array("q")
+        self._lats = array("d")
+        self._lons = array("d")
+        self._cells: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        row = min(int((lat + 90) / self.cell_size), self._rows - 1)
+        column = min(int((lon + 180) / self.cell_size), self._columns - 1)
+        return row, column
+
+    def _build(
+        self, points: Sequence[Tuple[int, float, float]]
+    ) -> Tuple[array, array, array, Dict[int, Tuple[int, int]]]:
+        """Массивы и диапазоны ячеек новой сетки; состояние индекса не меняет"""
+        # Раскладка по ячейкам без сортировки: построение в потоке пула не держит GIL
+        # одним долгим вызовом и не задерживает цикл событий
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        for point in points:
+            row, column = self._cell(point[1], point[2])
+            buckets.setdefault(row * self._columns + column, []).append(point)
+
+        ids, lats, lons = array("q"), array("d"), array("d")
+        cells: Dict[int, Tuple[int, int]] = {}
+        for key, bucket in buckets.items():
+            start = len(ids)
+            for building_id, lat, lon in bucket:
+                ids.append(building_id)
+                lats.append(lat)
+                lons.append(lon)
+            cells[key] = (start, len(ids))
+
+        return ids, lats, lons, cells
+
+    async def _load(self, db: AsyncSession) -> None:
+        """Построить индекс по всем зданиям одним запросом"""
+        result = await db.execute(select(Building.id, Building.latitude, Building.longitude))
+        grid = await asyncio.get_running_loop().run_in_executor(None, self._build, result.all())
+        self._ids, self._lats, self._lons, self._cells = grid
+
+    def _cell_ranges(self, min_row: int, max_row: int, min_column: int, max_column: int):
+        if (max_row - min_row + 1) * (max_column - min_column + 1) > len(self._cells):
+            # Область больше числа непустых ячеек: дешевле пройти по ним
+            for key, cell_range in self._cells.items():
+                row, column = divmod(key, self._columns)
+                if min_row <= row <= max_row and min_column <= column <= max_column:
+                    yield cell_range
+            return
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                cell_range = self._cells.get(row * self._columns + column)
+                if cell_range:
+                    yield cell_range
+
+    def rectangle(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> List[int]:
+        """ID зданий в прямоугольнике (границы включаются)"""
+        min_row, min_column = self._cell(min_lat, min_lon)
+        max_row, max_column = self._cell(max_lat, max_lon)
+        ids, lats, lons = self._ids, self._lats, self._lons
+        found = []
+        for start, end in self._cell_ranges(min_row, max_row, min_column, max_column):
+            for i in range(start, end):
+                if min_lat <= lats[i] <= max_lat and min_lon <= lons[i] <= max_lon:
+                    found.append(ids[i])
+        return found
+
+    def clusters(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float, cell_size: float
+    ) -> List[dict]:
+        """Здания прямоугольника по ячейкам сетки cell_size градусов, как BuildingRepository.get_clusters"""
+        cells: Dict[Tuple[int, int], list] = {}
+        min_row, min_column = self._cell(min_lat, min_lon)
+        max_row, max_column = self._cell(max_lat, max_lon)
+        ids, lats, lons = self._ids, self._lats, self._lons
+        points = (
+            (ids[i], lats[i], lons[i])
+            for start, end in self._cell_ranges(min_row, max_row, min_column, max_column)
+            for i in range(start, end)
+        )
+        for building_id, lat, lon in points:
+            if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                continue
+            # Сумма широт, сумма долгот, число зданий, наименьший id
+            key = grid_cell(lat, lon, cell_size)
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [lat, lon, 1, building_id]
+            else:
+                cell[0] += lat
+                cell[1] += lon
+                cell[2] += 1
+                cell[3] = min(cell[3], building_id)
+        return [
+            {"latitude": lat_sum / count, "longitude": lon_sum / count, "count": count, "sample_id": sample_id}
+            for _, (lat_sum, lon_sum, count, sample_id) in sorted(cells.items())
+        ]
+
+    def radius(self, lat: float, lon: float, radius_m: float) -> List[Tuple[int, float]]:
+        """Пары (id здания, расстояние в метрах) в радиусе от точки, ближайшие первыми"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+        min_row, min_column = self._cell(min_lat, min_lon)
+        max_row, max_column = self._cell(max_lat, max_lon)
+        ids, lats, lons = self._ids, self._lats, self._lons
+        found = []
+        for start, end in self._cell_ranges(min_row, max_row, min_column, max_column):
+            for i in range(start, end):
+                distance = haversine_m(lat, lon, lats[i], lons[i])
+                if distance <= radius_m:
+                    found.append((ids[i], distance))
+        found.sort(key=lambda match: (match[1], match[0]))
+        return found
+
+
+building_geo_index = BuildingGeoIndex(
+    cell_size=settings.GEO_INDEX_CELL_SIZE,
+    refresh_interval=settings.GEO_INDEX_REFRESH_INTERVAL
+)
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, List
+from app.config import settings
+from app.database import session_scope
+from app.repositories.organization_repository import (
+    DEFAULT_FIELDSET, ORGANIZATION_FIELDS, ORGANIZATION_INCLUDES, FieldSet, OrganizationRepository
+)
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def _batches(fieldset: FieldSet, primary: bool) -> AsyncIterator[List[dict]]:
+    # Своя сессия: ответ отдаётся дольше, чем живёт сессия запроса из get_current_db
+    async with session_scope(primary=primary) as db:
+        repository = OrganizationRepository(db)
+        async for rows in repository.stream_with_details(settings.EXPORT_BATCH_SIZE, fieldset):
+            yield rows
+
+
+def _csv_columns(fieldset: FieldSet) -> List[str]:
+    columns = [name for name in ORGANIZATION_FIELDS + ORGANIZATION_INCLUDES if fieldset.wants(name)]
+    if "building" in columns:
+        position = columns.index("building")
+        columns[position:position + 1] = ["building_address", "building_latitude", "building_longitude"]
+    return columns
+
+
+def _csv_row(row: dict) -> dict:
+    """Плоская строка CSV: телефоны и деятельности через "; ", здание - отдельными колонками"""
+    flat = dict(row)
+    if "phone_numbers" in flat:
+        flat["phone_numbers"] = "; ".join(phone["number"] for phone in flat["phone_numbers"])
+    if "activities" in flat:
+        flat["activities"] = "; ".join(activity["name"] for activity in flat["activities"])
+    building = flat.pop("building", None)
+    if building is not None:
+        flat["building_address"] = building["address"]
+        flat["building_latitude"] = building["latitude"]
+        flat["building_longitude"] = building["longitude"]
+    return flat
+
+
+async def export_organizations(
+    format: str, fieldset: FieldSet = DEFAULT_FIELDSET, primary: bool = False
+) -> AsyncIterator[str]:
+    """Весь справочник организаций в NDJSON или CSV: по куску текста на пачку строк из БД"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=_csv_columns(fieldset))
+        writer.writeheader()
+        # Заголовок уходит сразу, до первой пачки из БД
+        yield buffer.getvalue()
+        async for rows in _batches(fieldset, primary):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(_csv_row(row) for row in rows)
+            yield buffer.getvalue()
+        return
+
+    async for rows in _batches(fieldset, primary):
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
@@ -1,52 +1,191 @@
-from typing import List, Optional
+import math
+from typing import Dict, List, Optional, Tuple, Union
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.repositories.organization_repository import OrganizationRepository
+from app.config import settings
+from app.geo import EARTH_RADIUS_M
+from app.repositories.activity_repository import ActivityRepository
+from app.repositories.base_repository import Batch, Page
+from app.repositories.organization_repository import DEFAULT_FIELDSET, FieldSet, OrganizationRepository
+from app.services.geo_index import building_geo_index
+from app.services.single_flight import single_flight
 from app.schemas.organization import OrganizationResponse
 
+# Поиск ближайших: начинаем с небольшого круга и расширяем его, пока не наберём k
+NEAREST_START_RADIUS_M = 1000.0
+NEAREST_RADIUS_GROWTH = 4
+NEAREST_MAX_RADIUS_M = math.pi * EARTH_RADIUS_M
+
 
 class OrganizationService:
+    # Списки отдаются словарями из проекции колонок: схему ответа проверяет response_model роутера,
+    # поэтому ORM-объекты и промежуточные модели Pydantic для них не создаются.
+    # Публичные методы под single_flight: одновременные одинаковые вызовы делят один результат,
+    # поэтому возвращаемые страницы и словари вызывающие не меняют
     def __init__(self, db: AsyncSession):
         self.db = db
         self.organization_repo = OrganizationRepository(db)
 
-    async def get_organization(self, organization_id: int) -> Optional[OrganizationResponse]:
-        organization = await self.organization_repo.get_with_details(organization_id)
+    @single_flight()
+    async def get_organization(
+        self, organization_id: int, fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Optional[Union[OrganizationResponse, dict]]:
+        """Организация по ID; при неполном наборе полей - словарь только с запрошенными полями"""
+        organization = await self.organization_repo.get_with_details(organization_id, fieldset)
         if not organization:
             return None
-        
-        organization_data = {
-            "id": organization.id,
-            "name": organization.name,
-            "building_id": organization.building_id,
-            "phone_numbers": [
-                {"id": phone.id, "number": phone.number} 
+
+        organization_data = {"id": organization.id}
+        if fieldset.wants("name"):
+            organization_data["name"] = organization.name
+        if fieldset.wants("building_id"):
+            organization_data["building_id"] = organization.building_id
+        if fieldset.wants("phone_numbers"):
+            organization_data["phone_numbers"] = [
+                {"id": phone.id, "number": phone.number}
                 for phone in organization.phone_numbers
-            ],
-            "activities": [
+            ]
+        if fieldset.wants("activities"):
+            organization_data["activities"] = [
                 {"id": activity.id, "name": activity.name}
                 for activity in organization.activities
             ]
-        }
+        if fieldset.wants("building"):
+            building = organization.building
+            organization_data["building"] = {
+                "id": building.id, "address": building.address,
+                "latitude": building.latitude, "longitude": building.longitude
+            }
+        if not fieldset.is_default:
+            return organization_data
         return OrganizationResponse.model_validate(organization_data)
 
-    async def get_organizations_by_building(self, building_id: int) -> List[OrganizationResponse]:
-        organizations = await self.organization_repo.get_by_building(building_id)
-        return [OrganizationResponse.model_validate(org) for org in organizations]
+    @single_flight()
+    async def get_organizations_batch(self, ids: Tuple[int, ...], fieldset: FieldSet = DEFAULT_FIELDSET) -> Batch:
+        """Организации по списку ID в порядке запроса и ненайденные ID"""
+        return await self.organization_repo.get_batch_with_details(ids, fieldset)
 
-    async def get_organizations_by_activity(self, activity_id: int) -> List[OrganizationResponse]:
-        organizations = await self.organization_repo.get_by_activity(activity_id)
-        return [OrganizationResponse.model_validate(org) for org in organizations]
+    @single_flight()
+    async def get_organizations_by_building(
+        self, building_id: int, after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        query = self.organization_repo.query_by_building(building_id)
+        return await self.organization_repo.get_page_with_details(query, after, limit, with_total, fieldset)
 
-    async def get_organizations_by_activity_tree(self, activity_id: int) -> List[OrganizationResponse]:
-        organizations = await self.organization_repo.get_by_activity_tree(activity_id)
-        return [OrganizationResponse.model_validate(org) for org in organizations]
+    @single_flight()
+    async def get_organizations_by_activity(
+        self, activity_id: int, after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        query = self.organization_repo.query_by_activity(activity_id)
+        return await self.organization_repo.get_page_with_details(query, after, limit, with_total, fieldset)
 
+    @single_flight()
+    async def get_organizations_by_activity_tree(
+        self, activity_id: int, after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        query = await self.organization_repo.query_by_activity_tree(activity_id)
+        if query is None:
+            return Page([], total=0 if with_total else None)
+        return await self.organization_repo.get_page_with_details(query, after, limit, with_total, fieldset)
+
+    @single_flight()
     async def get_organizations_in_rectangle(
-        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> List[OrganizationResponse]:
-        organizations = await self.organization_repo.get_in_rectangle(min_lat, max_lat, min_lon, max_lon)
-        return [OrganizationResponse.model_validate(org) for org in organizations]
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+        after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        if settings.GEO_ENGINE == "memory":
+            await building_geo_index.refresh(self.db)
+            building_ids = building_geo_index.rectangle(min_lat, max_lat, min_lon, max_lon)
+            query = self.organization_repo.query_by_buildings(building_ids)
+        else:
+            query = self.organization_repo.query_in_rectangle(min_lat, max_lat, min_lon, max_lon)
+        return await self.organization_repo.get_page_with_details(query, after, limit, with_total, fieldset)
+
+    @single_flight()
+    async def get_organizations_in_radius(
+        self, lat: float, lon: float, radius_m: float, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        """Ближайшие limit организаций в радиусе; total - точное число найденных в круге"""
+        matches = await self._find_nearby_ids(lat, lon, radius_m, None)
+        distances = dict(matches[:self.organization_repo.page_size(limit)])
+        items = await self._with_distances(distances, fieldset)
+        return Page(items, total=len(matches) if with_total else None)
+
+    async def _with_distances(self, distances: Dict[int, float], fieldset: FieldSet = DEFAULT_FIELDSET) -> List[dict]:
+        """Организации по словарю {id: расстояние} с полем distance_m, ближайшие первыми"""
+        organizations = await self.organization_repo.get_by_ids(list(distances), fieldset)
+        for org in organizations:
+            org["distance_m"] = round(distances[org["id"]], 2)
+        organizations.sort(key=lambda org: (distances[org["id"]], org["id"]))
+        return organizations
+
+    async def _find_nearby_ids(
+        self, lat: float, lon: float, radius_m: float, activity_ids: Optional[List[int]]) -> List[Tuple[int, float]]:
+        if settings.GEO_ENGINE == "memory":
+            await building_geo_index.refresh(self.db)
+            distances = dict(building_geo_index.radius(lat, lon, radius_m))
+            pairs = await self.organization_repo.get_ids_by_buildings(list(distances), activity_ids)
+            return sorted(
+                ((organization_id, distances[building_id]) for organization_id, building_id in pairs),
+                key=lambda match: (match[1], match[0])
+            )
+        return await self.organization_repo.get_nearby_ids(lat, lon, radius_m, activity_ids)
+
+    @single_flight()
+    async def get_nearest_organizations(
+        self, lat: float, lon: float, k: int, activity_id: Optional[int] = None,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> List[dict]:
+        activity_ids = None
+        if activity_id is not None:
+            activity_ids = await ActivityRepository(self.db).get_subtree_ids(activity_id)
+            if not activity_ids:
+                return []
+
+        # Если в круге уже есть k организаций, то k ближайших точно среди них
+        radius_m = NEAREST_START_RADIUS_M
+        while True:
+            matches = await self._find_nearby_ids(lat, lon, radius_m, activity_ids)
+            if len(matches) >= k or radius_m >= NEAREST_MAX_RADIUS_M:
+                break
+            radius_m = min(radius_m * NEAREST_RADIUS_GROWTH, NEAREST_MAX_RADIUS_M)
+
+        return await self._with_distances(dict(matches[:k]), fieldset)
+
+    @single_flight()
+    async def search_organizations_by_name(
+        self, name: str, after: Optional[Tuple[float, int]] = None, limit: Optional[int] = None,
+        with_total: bool = False, fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        return await self.organization_repo.search_by_name(name, after, limit, with_total, fieldset)
+
+    @single_flight()
+    async def search_organizations(
+        self, activity_id: Optional[int] = None, rectangle: Optional[Tuple[float, float, float, float]] = None,
+        circle: Optional[Tuple[float, float, float]] = None, name: Optional[str] = None,
+        after: Optional[int] = None, limit: Optional[int] = None, with_total: bool = False,
+        fieldset: FieldSet = DEFAULT_FIELDSET
+    ) -> Page:
+        """Организации, подходящие под все заданные фильтры сразу, постранично в порядке id"""
+        activity_ids = None
+        if activity_id is not None:
+            activity_ids = await ActivityRepository(self.db).get_subtree_ids(activity_id)
+            if not activity_ids:
+                return Page([], total=0 if with_total else None)
 
-    async def search_organizations_by_name(self, name: str) -> List[OrganizationResponse]:
-        organizations = await self.organization_repo.search_by_name(name)
-        return [OrganizationResponse.model_validate(org) for org in organizations]
+        building_ids = None
+        if settings.GEO_ENGINE == "memory" and (rectangle is not None or circle is not None):
+            # Здания из индекса в памяти уходят в запрос массивом ID, как в поиске по прямоугольнику
+            await building_geo_index.refresh(self.db)
+            if rectangle is not None:
+                building_ids = building_geo_index.rectangle(*rectangle)
+            else:
+                building_ids = [building_id for building_id, _ in building_geo_index.radius(*circle)]
+            rectangle = circle = None
 
+        query = self.organization_repo.query_search(activity_ids, rectangle, circle, building_ids, name)
+        return await self.organization_repo.get_page_with_details(query, after, limit, with_total, fieldset)
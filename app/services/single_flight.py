@@ -0,0 +1,81 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+from app.config import settings
+from app.repositories.versioned_snapshot import session_data_versions
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """Запрос, выполнявший вычисление, отменён (клиент ушёл): ожидающие пробуют выполнить его сами"""
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вычислений.
+
+    Первый вызов с ключом выполняет вычисление, остальные ждут его результат
+    или исключение. Ждать дольше timeout секунд не будут: такой вызов
+    выполнит вычисление сам. Результат общий для всех ожидавших и не должен
+    меняться вызывающими.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[T]], timeout: float) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except _LeaderCancelled:
+                continue
+            except asyncio.TimeoutError:
+                return await compute()
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            # Исключение без ожидающих не должно попадать в лог как "never retrieved"
+            if future.done() and not future.cancelled():
+                future.exception()
+
+
+flights = SingleFlight()
+
+
+def single_flight(timeout: Optional[float] = None):
+    """Объединять одновременные вызовы метода сервиса с одинаковыми аргументами.
+
+    Ключ - имя метода, база, к которой привязана сессия (основная или реплика),
+    версии данных, прочитанные сессией для кэша ответов, и аргументы; аргументы
+    должны быть хешируемыми. Из-за версий в ключе запрос не получит результат,
+    посчитанный по данным старше тех, под которыми его ответ ляжет в кэш.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            key = (
+                method.__qualname__, self.db.bind, tuple(session_data_versions(self.db).items()),
+                args, frozenset(kwargs.items())
+            )
+            return await flights.do(
+                key, lambda: method(self, *args, **kwargs),
+                settings.SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+"""Сравнение двух JSON-отчётов benchmarks/api_routes.py.
+
+Для каждого сценария печатает p50/p99 и число SQL-запросов в обоих прогонах
+и изменение в процентах; сценарии, где p50 или p99 выросли больше --threshold
+процентов, помечаются, и скрипт завершается с кодом 1.
+
+    python benchmarks/compare.py before.json after.json --threshold 10
+"""
+import sys
+import argparse
+import json
+from typing import Optional
+
+
+def change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def format_change(value: Optional[float]) -> str:
+    return "      -" if value is None else f"{value:+6.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--mode", choices=["sequential", "concurrent"], default="sequential")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимый рост задержки, %%")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as file:
+        before = json.load(file)
+    with open(args.after, encoding="utf-8") as file:
+        after = json.load(file)
+    print(f"{args.before} ({before.get('git_commit')}) -> {args.after} ({after.get('git_commit')}), {args.mode}")
+    if before.get("parameters") != after.get("parameters"):
+        print("Внимание: параметры прогонов различаются")
+
+    print(f"{'сценарий':<28}{'p50':>18}{'Δp50':>9}{'p99':>18}{'Δp99':>9}{'sql':>12}")
+    regressions = 0
+    for name in sorted(set(before["scenarios"]) | set(after["scenarios"])):
+        old = before["scenarios"].get(name, {}).get(args.mode)
+        new = after["scenarios"].get(name, {}).get(args.mode)
+        if old is None or new is None:
+            print(f"{name:<28} есть только в {'after' if old is None else 'before'}")
+            continue
+        p50, p99 = change(old["p50_ms"], new["p50_ms"]), change(old["p99_ms"], new["p99_ms"])
+        regressed = any(value is not None and value > args.threshold for value in (p50, p99))
+        regressions += regressed
+        sql = f"{old.get('sql_per_request', '-')}->{new.get('sql_per_request', '-')}"
+        print(
+            f"{name:<28}{old['p50_ms']:>8.2f}->{new['p50_ms']:<8.2f}{format_change(p50):>9}"
+            f"{old['p99_ms']:>8.2f}->{new['p99_ms']:<8.2f}{format_change(p99):>9}{sql:>12}"
+            f"{'  <- регрессия' if regressed else ''}"
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Массовая загрузка справочника через COPY (asyncpg copy_records_to_table).
+
+Источник - каталог с файлами таблиц (buildings, activities, organizations,
+phone_numbers, organization_activities; .csv с заголовком или .ndjson), как их
+пишет scripts/generate_data.py, либо синтетический набор без промежуточных
+файлов (--synthetic). В одной транзакции с загрузкой заполняется
+activity_closure, поднимаются версии дерева деятельностей и справочника (кэши
+приложения перечитают данные) и сдвигаются последовательности id; затем
+обновляется статистика.
+
+    python scripts/bulk_load.py --from-dir data/ --truncate
+    python scripts/bulk_load.py --synthetic --organizations 1000000 --buildings 200000 --truncate
+"""
+import sys
+import os
+import argparse
+import asyncio
+import csv
+import json
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+from app.config import settings
+from app.database import engine
+from app.models.activity import ACTIVITIES_VERSION
+from app.models.building import BUILDINGS_VERSION
+from app.models.data_version import DIRECTORY_VERSION
+from app.models.organization import ORGANIZATIONS_VERSION
+from generate_data import TABLES, SyntheticDataset, add_dataset_arguments, dataset_from_arguments
+from seed_data import create_tables
+
+
+def _optional_int(value) -> Optional[int]:
+    return None if value in (None, "") else int(value)
+
+
+# Типы колонок: COPY в бинарном формате требует значения нужного типа, а CSV отдаёт строки
+COLUMN_TYPES: Dict[str, Callable] = {
+    "id": int,
+    "latitude": float,
+    "longitude": float,
+    "level": int,
+    "parent_id": _optional_int,
+    "building_id": int,
+    "organization_id": int,
+    "activity_id": int,
+}
+
+SEQUENCE_TABLES = ("buildings", "activities", "organizations", "phone_numbers")
+
+
+def read_table(path: str) -> Tuple[Tuple[str, ...], Iterator[tuple]]:
+    """Колонки и ленивый итератор типизированных строк файла таблицы"""
+    file = open(path, encoding="utf-8", newline="")
+    if path.endswith(".csv"):
+        reader = csv.reader(file)
+        columns = tuple(next(reader))
+        lines = reader
+    else:
+        first = file.readline()
+        columns = tuple(json.loads(first)) if first.strip() else ()
+        file.seek(0)
+        lines = (
+            [record.get(column) for column in columns]
+            for record in (json.loads(line) for line in file if line.strip())
+        )
+    converters = [COLUMN_TYPES.get(column, str) for column in columns]
+
+    def rows() -> Iterator[tuple]:
+        with file:
+            for values in lines:
+                yield tuple(convert(value) for convert, value in zip(converters, values))
+
+    return columns, rows()
+
+
+def find_table_file(directory: str, table: str) -> Optional[str]:
+    for extension in ("csv", "ndjson"):
+        path = os.path.join(directory, f"{table}.{extension}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+async def finish_load(conn: asyncpg.Connection) -> None:
+    """То, что при записи через ORM делают события моделей, и служебные шаги после COPY"""
+    # Замыкание дерева деятельностей (как в миграции 0001), существующие пары пропускаются
+    await conn.execute(
+        """
+        INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM activities
+            UNION ALL
+            SELECT tree.ancestor_id, activities.id, tree.depth + 1
+            FROM tree
+            JOIN activities ON activities.parent_id = tree.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+        ON CONFLICT DO NOTHING
+        """
+    )
+    # Новые версии наборов данных: кэши приложения (дерево, индексы названий и координат, ответы API) перечитают данные
+    for name in (ACTIVITIES_VERSION, BUILDINGS_VERSION, ORGANIZATIONS_VERSION, DIRECTORY_VERSION):
+        await conn.execute(
+            "INSERT INTO data_versions (name, version) VALUES ($1, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = data_versions.version + 1",
+            name
+        )
+    # Явные id из файлов не двигают последовательности: новые записи через API получили бы занятые id
+    for table in SEQUENCE_TABLES:
+        await conn.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+        )
+
+
+async def load_tables(
+    conn: asyncpg.Connection, tables: Iterable[Tuple[str, Sequence[str], Iterable[tuple]]], truncate: bool = False
+) -> None:
+    """COPY строк (таблица, колонки, строки) по порядку и завершающие шаги - в одной транзакции"""
+    async with conn.transaction():
+        if truncate:
+            await conn.execute(
+                "TRUNCATE organization_activities, phone_numbers, organizations, "
+                "activity_closure, activities, buildings RESTART IDENTITY"
+            )
+        for table, columns, rows in tables:
+            started = time.perf_counter()
+            status = await conn.copy_records_to_table(table, records=rows, columns=list(columns))
+            elapsed = time.perf_counter() - started
+            count = int(status.split()[-1])
+            print(f"{table:<24} {count:>10} строк  {elapsed:6.1f} с  {count / max(elapsed, 1e-9):>10.0f} строк/с")
+        await finish_load(conn)
+
+    for table in TABLES:
+        await conn.execute(f"ANALYZE {table}")
+    await conn.execute("ANALYZE activity_closure")
+
+
+def synthetic_tables(dataset: SyntheticDataset) -> Iterator[Tuple[str, Sequence[str], Iterator[tuple]]]:
+    for table, columns in TABLES.items():
+        yield table, columns, dataset.rows(table)
+
+
+def file_tables(directory: str) -> Iterator[Tuple[str, Sequence[str], Iterator[tuple]]]:
+    for table in TABLES:
+        path = find_table_file(directory, table)
+        if path is None:
+            print(f"{table:<24} файл не найден, пропускаем")
+            continue
+        columns, rows = read_table(path)
+        yield table, columns, rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-dir", help="Каталог с файлами таблиц .csv/.ndjson")
+    source.add_argument("--synthetic", action="store_true", help="Сгенерировать набор на лету (параметры ниже)")
+    parser.add_argument("--truncate", action="store_true", help="Очистить таблицы справочника перед загрузкой")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    await create_tables()
+    await engine.dispose()
+
+    conn = await asyncpg.connect(settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    try:
+        started = time.perf_counter()
+        if args.synthetic:
+            tables = synthetic_tables(dataset_from_arguments(args))
+        else:
+            tables = file_tables(args.from_dir)
+        await load_tables(conn, tables, truncate=args.truncate)
+        print(f"Готово за {time.perf_counter() - started:.1f} с")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""Детерминированный генератор синтетического справочника.
+
+Строит дерево деятельностей (roots корней, fanout детей у узла, не глубже
+depth <= 3 уровней), здания вокруг нескольких "городов" внутри заданного
+района и организации с телефонами и видами деятельности. Один и тот же --seed
+даёт одни и те же данные. Результат пишется по файлу на таблицу (CSV или
+NDJSON) в формате, который читает scripts/bulk_load.py:
+
+    python scripts/generate_data.py --out data/ --organizations 1000000 --buildings 200000
+
+Для загрузки без промежуточных файлов см. bulk_load.py --synthetic.
+"""
+import sys
+import os
+import argparse
+import csv
+import json
+import math
+import random
+import time
+from typing import Dict, Iterator, Tuple
+
+# Таблицы в порядке загрузки (по внешним ключам) и их колонки в файлах
+TABLES: Dict[str, Tuple[str, ...]] = {
+    "buildings": ("id", "address", "latitude", "longitude"),
+    "activities": ("id", "name", "parent_id", "level"),
+    "organizations": ("id", "name", "building_id"),
+    "phone_numbers": ("id", "number", "organization_id"),
+    "organization_activities": ("organization_id", "activity_id"),
+}
+
+MAX_ACTIVITY_DEPTH = 3
+KM_PER_DEGREE_LAT = 111.32
+
+_STREETS = ["Ленина", "Мира", "Тверская", "Садовая", "Советская", "Лесная", "Школьная", "Новая", "Полевая", "Речная"]
+_LEGAL_FORMS = ["ООО", "АО", "ИП", "ЗАО"]
+_WORDS = [
+    "Северный", "Южный", "Городской", "Первый", "Народный", "Столичный", "Добрый", "Быстрый",
+    "Хлеб", "Молоко", "Мясо", "Авто", "Мода", "Сервис", "Маркет", "Центр", "Двор", "Склад",
+]
+_ACTIVITY_WORDS = ["Еда", "Автомобили", "Одежда", "Услуги", "Строительство", "Техника", "Здоровье", "Спорт"]
+
+
+class SyntheticDataset:
+    """Строки таблиц справочника как ленивые итераторы кортежей в порядке колонок TABLES.
+
+    У каждой таблицы свой генератор случайных чисел от общего seed, поэтому
+    таблицы можно порождать независимо и в любом порядке.
+    """
+
+    def __init__(
+        self, buildings: int, organizations: int, roots: int = 8, fanout: int = 6, depth: int = MAX_ACTIVITY_DEPTH,
+        center: Tuple[float, float] = (55.7558, 37.6176), spread_km: float = 50.0, cities: int = 5,
+        max_phones: int = 3, max_activities: int = 3, seed: int = 42
+    ):
+        if not 1 <= depth <= MAX_ACTIVITY_DEPTH:
+            raise ValueError(f"Глубина дерева деятельностей должна быть от 1 до {MAX_ACTIVITY_DEPTH}")
+        self.buildings_count = buildings
+        self.organizations_count = organizations
+        self.roots = roots
+        self.fanout = fanout
+        self.depth = depth
+        self.center = center
+        self.spread_km = spread_km
+        self.cities = cities
+        self.max_phones = max_phones
+        self.max_activities = max_activities
+        self.seed = seed
+        self.activities_count = sum(roots * fanout ** level for level in range(depth))
+
+    def _random(self, table: str) -> random.Random:
+        return random.Random(f"{self.seed}:{table}")
+
+    def activities(self) -> Iterator[tuple]:
+        # Обход в ширину: сначала все корни, затем их дети и т.д.; id по порядку
+        level_nodes = []
+        next_id = 1
+        for root in range(self.roots):
+            name = _ACTIVITY_WORDS[root % len(_ACTIVITY_WORDS)]
+            if root >= len(_ACTIVITY_WORDS):
+                name = f"{name} {root // len(_ACTIVITY_WORDS) + 1}"
+            yield next_id, name, None, 1
+            level_nodes.append((next_id, name))
+            next_id += 1
+        for level in range(2, self.depth + 1):
+            children = []
+            for parent_id, parent_name in level_nodes:
+                for child in range(1, self.fanout + 1):
+                    name = f"{parent_name} / {child}"
+                    yield next_id, name, parent_id, level
+                    children.append((next_id, name))
+                    next_id += 1
+            level_nodes = children
+
+    def buildings(self) -> Iterator[tuple]:
+        rng = self._random("buildings")
+        lat0, lon0 = self.center
+        km_per_degree_lon = KM_PER_DEGREE_LAT * math.cos(math.radians(lat0))
+        # Центры "городов" равномерно в круге spread_km, здания - нормально вокруг них
+        centers = []
+        for _ in range(max(self.cities, 1)):
+            distance = self.spread_km * math.sqrt(rng.random())
+            angle = rng.uniform(0, 2 * math.pi)
+            centers.append((
+                lat0 + distance * math.sin(angle) / KM_PER_DEGREE_LAT,
+                lon0 + distance * math.cos(angle) / km_per_degree_lon,
+                self.spread_km / 10 * rng.uniform(0.5, 1.5)
+            ))
+        for building_id in range(1, self.buildings_count + 1):
+            city_lat, city_lon, city_km = centers[rng.randrange(len(centers))]
+            latitude = min(max(city_lat + rng.gauss(0, city_km) / KM_PER_DEGREE_LAT, -90.0), 90.0)
+            longitude = (city_lon + rng.gauss(0, city_km) / km_per_degree_lon + 180.0) % 360.0 - 180.0
+            address = f"ул. {rng.choice(_STREETS)}, д. {rng.randint(1, 200)}, корп. {building_id}"
+            yield building_id, address, round(latitude, 6), round(longitude, 6)
+
+    def organizations(self) -> Iterator[tuple]:
+        rng = self._random("organizations")
+        for organization_id in range(1, self.organizations_count + 1):
+            name = f'{rng.choice(_LEGAL_FORMS)} "{rng.choice(_WORDS)} {rng.choice(_WORDS)} {organization_id}"'
+            yield organization_id, name, rng.randint(1, self.buildings_count)
+
+    def phone_numbers(self) -> Iterator[tuple]:
+        rng = self._random("phone_numbers")
+        phone_id = 1
+        for organization_id in range(1, self.organizations_count + 1):
+            for _ in range(rng.randint(1, self.max_phones)):
+                number = "8-{}-{:03d}-{:02d}-{:02d}".format(
+                    rng.randint(800, 999), rng.randint(0, 999), rng.randint(0, 99), rng.randint(0, 99)
+                )
+                yield phone_id, number, organization_id
+                phone_id += 1
+
+    def organization_activities(self) -> Iterator[tuple]:
+        rng = self._random("organization_activities")
+        for organization_id in range(1, self.organizations_count + 1):
+            count = min(rng.randint(1, self.max_activities), self.activities_count)
+            for activity_id in sorted(rng.sample(range(1, self.activities_count + 1), count)):
+                yield organization_id, activity_id
+
+    def rows(self, table: str) -> Iterator[tuple]:
+        return getattr(self, table)()
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--buildings", type=int, default=10000)
+    parser.add_argument("--organizations", type=int, default=50000)
+    parser.add_argument("--roots", type=int, default=8, help="Корней дерева деятельностей")
+    parser.add_argument("--fanout", type=int, default=6, help="Детей у каждого узла дерева")
+    parser.add_argument("--depth", type=int, default=MAX_ACTIVITY_DEPTH, help="Уровней дерева (не больше 3)")
+    parser.add_argument("--center", type=float, nargs=2, default=(55.7558, 37.6176), metavar=("LAT", "LON"))
+    parser.add_argument("--spread-km", type=float, default=50.0, help="Радиус района с городами, км")
+    parser.add_argument("--cities", type=int, default=5, help="Скоплений зданий в районе")
+    parser.add_argument("--max-phones", type=int, default=3)
+    parser.add_argument("--max-activities", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def dataset_from_arguments(args: argparse.Namespace) -> SyntheticDataset:
+    return SyntheticDataset(
+        buildings=args.buildings, organizations=args.organizations, roots=args.roots, fanout=args.fanout,
+        depth=args.depth, center=tuple(args.center), spread_km=args.spread_km, cities=args.cities,
+        max_phones=args.max_phones, max_activities=args.max_activities, seed=args.seed
+    )
+
+
+def write_table(path: str, format: str, columns: Tuple[str, ...], rows: Iterator[tuple]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                file.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Каталог для файлов таблиц")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    dataset = dataset_from_arguments(args)
+    os.makedirs(args.out, exist_ok=True)
+    for table, columns in TABLES.items():
+        started = time.perf_counter()
+        path = os.path.join(args.out, f"{table}.{args.format}")
+        count = write_table(path, args.format, columns, dataset.rows(table))
+        print(f"{table:<24} {count:>10} строк  {time.perf_counter() - started:6.1f} с  -> {path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,25 @@ async def create_tables():
     """Создание всех таблиц"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await create_search_indexes()
+
+
+async def create_search_indexes():
+    """Триграммные индексы для поиска по подстроке (как в миграции 0005)"""
+    async with engine.begin() as conn:
+        available = await conn.scalar(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+        if not available:
+            print("Расширение pg_trgm недоступно, поиск по названию будет работать через индекс в памяти")
+            return
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index_name, table, column in [
+            ("ix_organizations_name_trgm", "organizations", "name"),
+            ("ix_buildings_address_trgm", "buildings", "address"),
+            ("ix_activities_name_trgm", "activities", "name"),
+        ]:
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING gin ({column} gin_trgm_ops)"
+            ))
 
 async def seed_data():
     """Заполнение тестовыми данными"""